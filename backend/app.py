@@ -1,35 +1,141 @@
 # app.py
 import os
+import time
 import shutil
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from constants import IMAGES_FOLDER, THUMBNAILS_FOLDER
+from constants import (
+    IMAGES_FOLDER,
+    OBJECTS_FOLDER,
+    THUMBNAILS_FOLDER,
+    PUBLIC_TAGS_FOLDER,
+    DEFAULT_TAGS_FOLDER,
+    TAG_FILES,
+    SLOW_REQUEST_SECONDS,
+    SHUTDOWN_DRAIN_SECONDS,
+)
 from routes.images import router as images_router
 from routes.tags import router as tags_router
 from routes.generate import router as generate_router
 from routes.restore import router as restore_router
+from routes.metrics import router as metrics_router
+from routes.health import router as health_router
+from jobs import job_manager
+from thumbnails import shutdown_thumbnail_pool
+from image_index import image_index
+from utils import sync_image_index, watch_images_folder
+from duplicates import backfill_hashes
+from events import event_broker
+from tag_index import load_tag_index, compile_tag_index
+from tag_store import tag_store, STORE_FILES
+from workflows import workflow_registry, DEFAULT_WORKFLOW
+from snapshots import snapshot_manager
 
-# Constants
-PUBLIC_TAGS_FOLDER = "./public/tags"
-DEFAULT_TAGS_FOLDER = "./default/tags"
+STARTUP_RETRY_SECONDS = 5.0  # First wait before retrying a failed startup, doubled each time
+STARTUP_RETRY_MAX_SECONDS = 300.0
+from metrics import MetricsMiddleware
+from profiler import SlowRequestProfiler
 
 def ensure_tags_folder():
     """Ensure the ./public/tags folder exists, copying from ./default/tags if necessary."""
     if not os.path.exists(PUBLIC_TAGS_FOLDER):
         if not os.path.exists(DEFAULT_TAGS_FOLDER):
             raise FileNotFoundError(f"Default tags folder not found at {DEFAULT_TAGS_FOLDER}")
-        shutil.copytree(DEFAULT_TAGS_FOLDER, PUBLIC_TAGS_FOLDER)
+        # Copy aside and rename into place, so an interrupted copy can't
+        # leave a half-copied folder behind
+        temp_folder = f"{PUBLIC_TAGS_FOLDER}.{os.getpid()}.tmp"
+        shutil.copytree(DEFAULT_TAGS_FOLDER, temp_folder)
+        try:
+            os.rename(temp_folder, PUBLIC_TAGS_FOLDER)
+        except OSError:
+            shutil.rmtree(temp_folder, ignore_errors=True)
     else:
         print(f"Tags folder found at {PUBLIC_TAGS_FOLDER}")
 
-# Ensure folders exist
-os.makedirs(IMAGES_FOLDER, exist_ok=True)
-os.makedirs(THUMBNAILS_FOLDER, exist_ok=True)
-ensure_tags_folder()
+def prepare_folders():
+    os.makedirs(IMAGES_FOLDER, exist_ok=True)
+    os.makedirs(OBJECTS_FOLDER, exist_ok=True)
+    os.makedirs(THUMBNAILS_FOLDER, exist_ok=True)
+    ensure_tags_folder()
+    # Finish a tag restore that was interrupted by a crash
+    snapshot_manager.recover()
+
+def tag_index_files() -> list:
+    return [os.path.join(PUBLIC_TAGS_FOLDER, file_name) for file_name in TAG_FILES.values()]
+
+def compile_tag_indexes():
+    """Compile the tag indexes up front, so startup only has to map them."""
+    for file_path in tag_index_files():
+        if os.path.exists(file_path):
+            compile_tag_index(file_path)
+
+def warm_indexes():
+    """Map every tag index and open the stores, so first requests don't pay for it."""
+    for file_path in tag_index_files():
+        if os.path.exists(file_path):
+            load_tag_index(file_path)
+    for key in STORE_FILES:
+        tag_store.deleted_index(key)
+    workflow_registry.get(DEFAULT_WORKFLOW)
+    image_index.count()
+
+async def start_up(app: FastAPI):
+    """
+    Index the library and warm caches, then start the background tasks and
+    mark the server ready. A failed attempt is retried with backoff.
+    """
+    started = time.perf_counter()
+    delay = STARTUP_RETRY_SECONDS
+    while True:
+        try:
+            # Pick up images added or removed while the server was down
+            await asyncio.to_thread(sync_image_index)
+            await asyncio.to_thread(warm_indexes)
+            break
+        except Exception as e:
+            print(f"Startup failed, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, STARTUP_RETRY_MAX_SECONDS)
+    app.state.watcher = asyncio.create_task(watch_images_folder())
+    app.state.hasher = asyncio.create_task(backfill_hashes())
+    app.state.ready = True
+    print(f"Ready in {time.perf_counter() - started:.1f}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(prepare_folders)
+    event_broker.bind(asyncio.get_running_loop())
+    job_manager.client.start()
+    app.state.ready = False
+    app.state.draining = False
+    app.state.watcher = None
+    app.state.hasher = None
+    # Warm up in the background so /health answers while it runs
+    startup = asyncio.create_task(start_up(app))
+    yield
+    app.state.ready = False
+    app.state.draining = True
+    # Let running generations finish before the ComfyUI connection closes
+    unfinished = await job_manager.drain(SHUTDOWN_DRAIN_SECONDS)
+    if unfinished:
+        print(f"Shutting down with {unfinished} generation jobs unfinished")
+    startup.cancel()
+    for task in (app.state.watcher, app.state.hasher):
+        if task is not None:
+            task.cancel()
+    # Close the ComfyUI connections, worker pool and index on shutdown
+    await job_manager.close()
+    shutdown_thumbnail_pool()
+    image_index.close()
 
 # FastAPI app setup
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+slow_request_profiler = SlowRequestProfiler(SLOW_REQUEST_SECONDS) if SLOW_REQUEST_SECONDS else None
+app.state.slow_request_profiler = slow_request_profiler
+app.add_middleware(MetricsMiddleware, profiler=slow_request_profiler)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -43,3 +149,5 @@ app.include_router(images_router)
 app.include_router(tags_router)
 app.include_router(generate_router)
 app.include_router(restore_router)
+app.include_router(metrics_router)
+app.include_router(health_router)
@@ -0,0 +1,236 @@
+# bench/__main__.py
+"""
+Benchmark the backend's hot paths against synthetic data.
+
+Run from the backend folder:
+
+    python -m bench --tags 100000 --images 10000 --check
+
+Data is generated into a scratch folder that becomes the working
+directory, so the app's relative ./public and ./default paths point at it.
+Requests go through an in-process TestClient and generation runs against
+a stub ComfyUI server, so the numbers cover the app and not the network.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+
+BACKEND_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_FOLDER not in sys.path:
+    sys.path.insert(0, BACKEND_FOLDER)
+
+from bench.generators import write_tag_files, generate_image_library
+from bench.harness import Result, measure, load_thresholds, check, format_table
+from bench.stub_comfy import start_stub_server
+
+BENCHMARKS = (
+    "autocomplete", "random_tag", "images", "thumbnails", "generation",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare(workdir: str, tag_count: int, image_count: int, seed: int) -> dict:
+    """Generate tag files and an image library under `workdir`, unless already there."""
+    default_folder = os.path.join(workdir, "default")
+    marker = os.path.join(workdir, "bench.json")
+    expected = {"tags": tag_count, "images": image_count, "seed": seed}
+    if os.path.exists(marker):
+        with open(marker, "r") as file:
+            if json.load(file) == expected:
+                with open(os.path.join(default_folder, "tags", "danbooru.json"), "r") as tags_file:
+                    return {"danbooru.json": json.load(tags_file)}
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(default_folder)
+    shutil.copy(os.path.join(BACKEND_FOLDER, "default", "prompt.json"), default_folder)
+    if os.path.isdir(os.path.join(BACKEND_FOLDER, "default", "workflows")):
+        shutil.copytree(os.path.join(BACKEND_FOLDER, "default", "workflows"), os.path.join(default_folder, "workflows"))
+
+    started = time.perf_counter()
+    tags = write_tag_files(os.path.join(default_folder, "tags"), tag_count, seed)
+    print(f"Generated {tag_count} tags per category in {time.perf_counter() - started:.1f}s")
+    started = time.perf_counter()
+    generate_image_library(
+        os.path.join(workdir, "public", "images"),
+        image_count,
+        [tag["character"] for tag in tags["char.json"][:200]],
+        [tag["artist"] for tag in tags["artist.json"][:200]],
+        seed,
+    )
+    print(f"Generated {image_count} images in {time.perf_counter() - started:.1f}s")
+    with open(marker, "w") as file:
+        json.dump(expected, file)
+    return tags
+
+
+def query_terms(tags: list, count: int, rng: random.Random) -> list:
+    """Substrings of real tag names, 2-6 characters long, as typed into autocomplete."""
+    terms = []
+    for _ in range(count):
+        tag = rng.choice(tags)["tag"]
+        length = rng.randint(2, 6)
+        start = rng.randrange(max(1, len(tag) - length))
+        terms.append(tag[start:start + length])
+    return terms
+
+
+def bench_autocomplete(client, tags: list, iterations: int, rng: random.Random) -> list:
+    terms = query_terms(tags, iterations, rng)
+    misses = ["zq" + term for term in terms]
+    return [
+        measure("autocomplete", lambda i: client.get("/tags/danbooru/", params={"q": terms[i]}), iterations, 10),
+        measure(
+            "autocomplete_miss",
+            lambda i: client.get("/tags/danbooru/", params={"q": misses[i]}),
+            iterations,
+            10,
+        ),
+    ]
+
+
+def bench_random_tag(client, iterations: int) -> list:
+    return [
+        measure("random_tag", lambda i: client.get("/tags/danbooru/random"), iterations, 10),
+        measure(
+            "random_tag_weighted",
+            lambda i: client.get("/tags/danbooru/random", params={"weighted": True}),
+            iterations,
+            10,
+        ),
+    ]
+
+
+def bench_images(client, iterations: int) -> list:
+    cursors = [None]
+
+    def page(i):
+        params = {"limit": 100, "sort": "newest"}
+        if cursors[-1]:
+            params["cursor"] = cursors[-1]
+        cursors.append(client.get("/images/", params=params).json()["next_cursor"])
+
+    return [
+        measure("images_page", page, iterations, 5),
+        measure("images_full_listing", lambda i: client.get("/images/"), max(1, iterations // 20), 1),
+    ]
+
+
+def bench_thumbnails(client, iterations: int, rng: random.Random) -> list:
+    listing = client.get("/images/", params={"limit": 1000}).json()["images"]
+    names = [entry["title"] + ".png" for entry in listing]
+    cold = names[:iterations]
+    warm = [rng.choice(cold) for _ in range(iterations)]
+    return [
+        measure("thumbnail_cold", lambda i: client.get(f"/thumb/{cold[i]}"), len(cold)),
+        measure("thumbnail_warm", lambda i: client.get(f"/thumb/{warm[i]}"), iterations),
+        measure(
+            "thumbnail_variant",
+            lambda i: client.get(f"/thumb/{cold[i]}", params={"size": 128, "format": "webp"}),
+            len(cold),
+        ),
+    ]
+
+
+def bench_generation(client, job_manager, count: int) -> list:
+    prompts = [
+        {
+            "positive_clip": f"bench prompt {i}",
+            "negative_clip": "",
+            "character_tags": ["bench"],
+            "artist_tags": ["stub"],
+        }
+        for i in range(count)
+    ]
+    started = time.perf_counter()
+    batch_id = client.post("/batches/", json={"prompts": prompts}).json()["batch_id"]
+    while client.get(f"/batches/{batch_id}").json()["status"] != "completed":
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    jobs = job_manager.get_batch(batch_id).jobs
+    failed = [job.error for job in jobs if job.status != "completed"]
+    if failed:
+        print(f"generation: {len(failed)} jobs failed, e.g. {failed[0]}")
+    return [Result("generation", [job.finished - job.created for job in jobs], elapsed)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ComfyGallery backend.")
+    parser.add_argument("--tags", type=int, default=10_000, help="Tags per category")
+    parser.add_argument("--images", type=int, default=1_000, help="Images in the library")
+    parser.add_argument("--iterations", type=int, default=200, help="Requests per latency benchmark")
+    parser.add_argument("--jobs", type=int, default=50, help="Prompts in the generation benchmark")
+    parser.add_argument("--delay", type=float, default=0.02, help="Stub ComfyUI seconds per prompt")
+    parser.add_argument("--backends", type=int, default=1, help="Stub ComfyUI servers to dispatch to")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Run only these benchmarks")
+    parser.add_argument("--workdir", help="Scratch folder, reused between runs (default: a temporary one)")
+    parser.add_argument("--thresholds", help="JSON file overriding the default thresholds")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero if a threshold is missed")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="comfygallery-bench-"))
+    tags = prepare(workdir, args.tags, args.images, args.seed)["danbooru.json"]
+    os.chdir(workdir)
+
+    # Imported after the chdir so the app's relative paths resolve to workdir
+    from fastapi.testclient import TestClient
+    from app import app
+    from comfy_pool import ComfyPool
+    from jobs import job_manager
+
+    addresses = []
+    for _ in range(args.backends):
+        port = free_port()
+        start_stub_server(port, delay=args.delay)
+        addresses.append(f"127.0.0.1:{port}")
+    job_manager.client = ComfyPool(addresses)
+
+    selected = args.only or BENCHMARKS
+    rng = random.Random(args.seed)
+    results = []
+    started = time.perf_counter()
+    with TestClient(app) as client:
+        # Startup indexes the generated library and warms the tag indexes
+        while client.get("/ready").status_code != 200:
+            time.sleep(0.01)
+        results.append(Result("startup", [time.perf_counter() - started], time.perf_counter() - started))
+        if "autocomplete" in selected:
+            results += bench_autocomplete(client, tags, args.iterations, rng)
+        if "random_tag" in selected:
+            results += bench_random_tag(client, args.iterations)
+        if "images" in selected:
+            results += bench_images(client, args.iterations)
+        if "thumbnails" in selected:
+            results += bench_thumbnails(client, min(args.iterations, args.images), rng)
+        if "generation" in selected:
+            results += bench_generation(client, job_manager, args.jobs)
+
+    print(format_table(results))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump([result.to_dict() for result in results], file, indent=2)
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failures = check(results, load_thresholds(args.thresholds))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# bench/generators.py
+import os
+import json
+import random
+import string
+
+from PIL import Image
+
+SYLLABLES = [a + b for a in "bdfghkmnprstyz" for b in "aeiou"] + ["n", "x", "ri", "sho", "kyo"]
+
+
+def _word(rng: random.Random, parts: int) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(parts))
+
+
+def _name(rng: random.Random) -> str:
+    """A danbooru-style tag name: words joined by underscores, sometimes qualified."""
+    words = [_word(rng, rng.randint(1, 4)) for _ in range(rng.randint(1, 3))]
+    name = "_".join(words)
+    if rng.random() < 0.2:
+        name += f"_({_word(rng, rng.randint(2, 3))})"
+    if rng.random() < 0.05:
+        name += rng.choice(string.digits)
+    return name
+
+
+def _display(name: str) -> str:
+    # Tags are stored the way they are typed into a prompt
+    return name.replace("_", " ").replace("(", "\\(").replace(")", "\\)")
+
+
+def generate_tags(count: int, category: str = "danbooru", seed: int = 0) -> list:
+    """
+    Generate `count` unique tags shaped like the entries of `category`'s tag
+    file, with a Zipf-like count distribution, sorted by tag like the
+    shipped files.
+    """
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        names.add(_name(rng))
+    names = list(names)
+    rng.shuffle(names)
+
+    tags = []
+    for rank, name in enumerate(names):
+        tag_count = int(1_000_000 / (rank + 1) ** 1.1) + 1
+        url = f"https://danbooru.donmai.us/posts?tags={name}"
+        if category == "artist":
+            tags.append({"artist": name, "tag": _display(name), "count": tag_count, "url": url})
+        elif category == "character":
+            copyright = f"{_word(rng, 3)}_(series)"
+            tags.append({
+                "character": name,
+                "copyright": copyright,
+                "tag": f"{_display(name)}, {_display(copyright)}",
+                "core_tags": ", ".join(_display(_name(rng)) for _ in range(5)),
+                "count": tag_count,
+                "solo_count": tag_count // 2,
+                "url": url,
+            })
+        else:
+            tags.append({"tag": _display(name), "count": tag_count})
+    tags.sort(key=lambda tag: tag["tag"])
+    return tags
+
+
+def write_tag_files(folder: str, count: int, seed: int = 0) -> dict:
+    """Write synthetic artist, char, danbooru and participant files; returns their tags."""
+    os.makedirs(folder, exist_ok=True)
+    files = {
+        "artist.json": generate_tags(count, "artist", seed),
+        "char.json": generate_tags(count, "character", seed + 1),
+        "danbooru.json": generate_tags(count, "danbooru", seed + 2),
+        "participant.json": [{"tag": "1girl", "count": 2}, {"tag": "1boy", "count": 1}],
+    }
+    for file_name, tags in files.items():
+        with open(os.path.join(folder, file_name), "w") as file:
+            json.dump(tags, file, separators=(",", ":"))
+    return files
+
+
+def render_png(rng: random.Random, size: tuple = (64, 96)) -> Image.Image:
+    """A small image with random blocks, so every file has different content."""
+    image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(4):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        block = Image.new("RGB", (size[0] // 4, size[1] // 4), tuple(rng.randrange(256) for _ in range(3)))
+        image.paste(block, (x, y))
+    return image
+
+
+def generate_image_library(
+    folder: str,
+    count: int,
+    characters: list,
+    artists: list,
+    seed: int = 0,
+    size: tuple = (64, 96),
+) -> list:
+    """
+    Write `count` PNGs named `{character}_{artist}_{n}.png`, drawing the
+    names from the given tag names and spreading mtimes over the last year.
+    Returns the filenames.
+    """
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    counters = {}
+    filenames = []
+    now = 1_700_000_000
+    for _ in range(count):
+        base = f"{rng.choice(characters)}_{rng.choice(artists)}"
+        counters[base] = counters.get(base, 0) + 1
+        filename = f"{base}_{counters[base]}.png"
+        path = os.path.join(folder, filename)
+        render_png(rng, size).save(path, "PNG", compress_level=1)
+        mtime = now - rng.randrange(365 * 24 * 3600)
+        os.utime(path, (mtime, mtime))
+        filenames.append(filename)
+    return filenames
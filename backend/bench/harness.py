@@ -0,0 +1,103 @@
+# bench/harness.py
+import json
+import time
+import math
+
+# Benchmark name -> limits. p50_ms/p99_ms are upper bounds on request
+# latency; min_throughput is a lower bound in operations per second.
+DEFAULT_THRESHOLDS = {
+    "autocomplete": {"p99_ms": 25},
+    "autocomplete_miss": {"p99_ms": 25},
+    "random_tag": {"p99_ms": 10},
+    "random_tag_weighted": {"p99_ms": 10},
+    "images_page": {"p99_ms": 50},
+    "images_full_listing": {"p99_ms": 2000},
+    "thumbnail_cold": {"p99_ms": 500},
+    "thumbnail_warm": {"p99_ms": 25},
+    "thumbnail_variant": {"p99_ms": 500},
+    "generation": {"min_throughput": 5},
+}
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return math.nan
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Result:
+    """Latencies of one benchmark, in seconds, and the wall time they took."""
+
+    def __init__(self, name: str, latencies: list, elapsed: float):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.elapsed = elapsed
+
+    @property
+    def p50_ms(self) -> float:
+        return percentile(self.latencies, 0.50) * 1000
+
+    @property
+    def p99_ms(self) -> float:
+        return percentile(self.latencies, 0.99) * 1000
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed if self.elapsed else math.nan
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "count": len(self.latencies),
+            "p50_ms": round(self.p50_ms, 3),
+            "p99_ms": round(self.p99_ms, 3),
+            "throughput": round(self.throughput, 2),
+        }
+
+
+def measure(name: str, operation, iterations: int, warmup: int = 0) -> Result:
+    """Time `operation(i)` for each iteration, after `warmup` untimed calls."""
+    for i in range(warmup):
+        operation(i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - call_started)
+    return Result(name, latencies, time.perf_counter() - started)
+
+
+def load_thresholds(path: str = None) -> dict:
+    """The default thresholds, overridden per benchmark by a JSON file."""
+    thresholds = {name: dict(limits) for name, limits in DEFAULT_THRESHOLDS.items()}
+    if path:
+        with open(path, "r") as file:
+            for name, limits in json.load(file).items():
+                thresholds.setdefault(name, {}).update(limits)
+    return thresholds
+
+
+def check(results: list, thresholds: dict) -> list:
+    """Return a message for every result outside its thresholds."""
+    failures = []
+    for result in results:
+        limits = thresholds.get(result.name, {})
+        for metric in ("p50_ms", "p99_ms"):
+            if metric in limits and getattr(result, metric) > limits[metric]:
+                failures.append(f"{result.name}: {metric} {getattr(result, metric):.2f} > {limits[metric]}")
+        if "min_throughput" in limits and result.throughput < limits["min_throughput"]:
+            failures.append(f"{result.name}: throughput {result.throughput:.2f}/s < {limits['min_throughput']}")
+    return failures
+
+
+def format_table(results: list) -> str:
+    lines = [f"{'benchmark':<26}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'ops/s':>10}"]
+    for result in results:
+        lines.append(
+            f"{result.name:<26}{len(result.latencies):>8}{result.p50_ms:>10.2f}"
+            f"{result.p99_ms:>10.2f}{result.throughput:>10.1f}"
+        )
+    return "\n".join(lines)
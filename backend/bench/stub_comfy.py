@@ -0,0 +1,161 @@
+# bench/stub_comfy.py
+"""
+Stand-in for a ComfyUI server, speaking the parts of its protocol the
+backend uses: POST /prompt queues a workflow, and /ws streams queue
+`status`, `executing` messages for each node, sampler `progress` with
+JPEG preview frames, and the output image as a binary frame while the
+SaveImageWebsocket node runs. Prompts run one at a time, like ComfyUI's
+queue.
+"""
+import io
+import json
+import uuid
+import struct
+import random
+import asyncio
+import argparse
+import threading
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.routing import Route, WebSocketRoute
+from starlette.responses import JSONResponse
+
+from bench.generators import render_png
+
+OUTPUT_NODE = "save_image_websocket_node"
+PREVIEW_IMAGE = 1  # Binary event type used for preview and websocket-saved images
+JPEG_FORMAT = 1
+PNG_FORMAT = 2
+
+
+class StubComfy:
+    """
+    `delay` is the simulated sampling time per prompt, spread over `steps`
+    progress messages, each followed by a preview frame when `previews` is
+    set; `image_size` is the size of the returned PNG.
+    """
+
+    def __init__(self, delay: float = 0.05, steps: int = 4, image_size: tuple = (64, 96), previews: bool = True):
+        self.delay = delay
+        self.steps = steps
+        self.image_size = image_size
+        self.previews = previews
+        self.clients = {}
+        self.queue = None
+        self.completed = 0
+        self.app = Starlette(
+            routes=[
+                Route("/prompt", self.prompt, methods=["POST"]),
+                Route("/queue", self.queue_status, methods=["GET"]),
+                WebSocketRoute("/ws", self.websocket),
+            ],
+            on_startup=[self.startup],
+        )
+
+    async def startup(self):
+        self.queue = asyncio.Queue()
+        asyncio.create_task(self.worker())
+
+    async def prompt(self, request):
+        body = await request.json()
+        prompt = body.get("prompt")
+        if not isinstance(prompt, dict) or OUTPUT_NODE not in prompt:
+            return JSONResponse({"error": "invalid prompt", "node_errors": {}}, status_code=400)
+        prompt_id = body.get("prompt_id") or str(uuid.uuid4())
+        await self.queue.put((prompt_id, body.get("client_id"), prompt))
+        await self._broadcast_status()
+        return JSONResponse({"prompt_id": prompt_id, "number": self.queue.qsize(), "node_errors": {}})
+
+    async def queue_status(self, request):
+        return JSONResponse({"queue_running": [], "queue_pending": [None] * self.queue.qsize()})
+
+    async def websocket(self, websocket):
+        await websocket.accept()
+        client_id = websocket.query_params.get("clientId", "")
+        self.clients[client_id] = websocket
+        try:
+            while True:
+                await websocket.receive_text()
+        except Exception:
+            pass
+        finally:
+            if self.clients.get(client_id) is websocket:
+                del self.clients[client_id]
+
+    async def _send(self, client_id: str, message):
+        websocket = self.clients.get(client_id)
+        if websocket is None:
+            return
+        try:
+            if isinstance(message, bytes):
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_text(json.dumps(message))
+        except Exception:
+            self.clients.pop(client_id, None)
+
+    async def _broadcast_status(self):
+        status = {"type": "status", "data": {"status": {"exec_info": {"queue_remaining": self.queue.qsize()}}}}
+        for client_id in list(self.clients):
+            await self._send(client_id, status)
+
+    def _render_preview(self, prompt: dict, step: int) -> bytes:
+        rng = random.Random(f"{json.dumps(prompt, sort_keys=True)}{step}")
+        buffer = io.BytesIO()
+        render_png(rng, (32, 48)).save(buffer, "JPEG", quality=50)
+        return buffer.getvalue()
+
+    def _render(self, prompt: dict) -> bytes:
+        # Same workflow (and so same seed) gives the same image, like ComfyUI
+        rng = random.Random(json.dumps(prompt, sort_keys=True))
+        buffer = io.BytesIO()
+        render_png(rng, self.image_size).save(buffer, "PNG", compress_level=1)
+        return buffer.getvalue()
+
+    async def worker(self):
+        while True:
+            prompt_id, client_id, prompt = await self.queue.get()
+            await self._broadcast_status()
+            await self._send(client_id, {"type": "execution_start", "data": {"prompt_id": prompt_id}})
+            for node in prompt:
+                await self._send(client_id, {"type": "executing", "data": {"node": node, "prompt_id": prompt_id}})
+                if prompt[node].get("class_type", "").startswith(("KSampler", "ImpactKSampler")):
+                    for step in range(1, self.steps + 1):
+                        await asyncio.sleep(self.delay / self.steps)
+                        await self._send(client_id, {
+                            "type": "progress",
+                            "data": {"value": step, "max": self.steps, "prompt_id": prompt_id, "node": node},
+                        })
+                        if self.previews:
+                            preview = self._render_preview(prompt, step)
+                            await self._send(client_id, struct.pack(">II", PREVIEW_IMAGE, JPEG_FORMAT) + preview)
+                if node == OUTPUT_NODE:
+                    image = await asyncio.to_thread(self._render, prompt)
+                    await self._send(client_id, struct.pack(">II", PREVIEW_IMAGE, PNG_FORMAT) + image)
+            await self._send(client_id, {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+            self.completed += 1
+
+
+def start_stub_server(port: int, **options) -> tuple:
+    """Run a stub server on a background thread; returns (stub, uvicorn server)."""
+    stub = StubComfy(**options)
+    server = uvicorn.Server(uvicorn.Config(stub.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        threading.Event().wait(0.01)
+    return stub, server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a stand-in ComfyUI server.")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--delay", type=float, default=0.5, help="Seconds of simulated sampling per prompt")
+    parser.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+    stub = StubComfy(delay=args.delay, steps=args.steps)
+    uvicorn.run(stub.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
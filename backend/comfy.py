@@ -0,0 +1,308 @@
+# comfy.py
+import asyncio
+import json
+import time
+import uuid
+import threading
+import urllib.error
+import urllib.request
+from websocket import create_connection
+
+from constants import SERVER_ADDRESS, CLIENT_ID
+from metrics import COMFY_PHASE_SECONDS, COMFY_RECEIVED_BYTES
+
+OUTPUT_NODE = "save_image_websocket_node"
+PREVIEW_IMAGE = 1  # Binary frame type of an encoded (JPEG or PNG) image
+SUBMIT_TIMEOUT = 30  # Seconds to wait for ComfyUI to accept a prompt
+
+
+class ComfyError(Exception):
+    """Raised when ComfyUI rejects or fails to execute a prompt."""
+
+
+class ComfyRejected(ComfyError):
+    """Raised when ComfyUI refuses a prompt as invalid, which no other server would accept either."""
+
+
+class ComfyUnavailable(ComfyError):
+    """Raised when the connection to ComfyUI is lost or can't be made."""
+
+
+class _PromptTracker:
+    """Collects the websocket messages belonging to a single prompt."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.current_node = None
+        self.images = {}
+        self.future = loop.create_future()
+        self.listener = None  # Called with each progress event, see ComfyClient.queue_prompt
+        # perf_counter timestamps of the prompt's phases
+        self.queued = None
+        self.started = None
+        self.output_started = None
+        self.finished = None
+
+    def finish(self):
+        if not self.future.done():
+            self.finished = time.perf_counter()
+            self.future.set_result(self.images)
+
+    def observe_phases(self):
+        """Record how long the prompt waited, executed and took to send its images."""
+        phases = (
+            ("queued", self.queued, self.started),
+            ("executing", self.started, self.output_started),
+            ("transfer", self.output_started, self.finished),
+        )
+        for phase, start, end in phases:
+            if start is not None and end is not None:
+                COMFY_PHASE_SECONDS.observe(end - start, phase=phase)
+
+    def fail(self, error: Exception):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+    def emit(self, kind: str, **data):
+        if self.listener is not None:
+            self.listener(kind, **data)
+
+
+class ComfyClient:
+    """
+    Shared connection to a ComfyUI server.
+
+    A single long-lived websocket is read on a background thread and its
+    messages are handed to the event loop, where they are demultiplexed by
+    `prompt_id`, so any number of prompts can be awaited concurrently
+    without blocking request handlers.
+    """
+
+    def __init__(self, server_address: str = SERVER_ADDRESS, client_id: str = CLIENT_ID):
+        self.server_address = server_address
+        self.client_id = client_id
+        self._ws = None
+        self._loop = None
+        self._connect_lock = None
+        self._trackers = {}
+        self._executing = None
+        self._queue_remaining = None
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None
+
+    @property
+    def queue_remaining(self):
+        """ComfyUI's queue length as of its last status message, or None."""
+        return self._queue_remaining if self._ws is not None else None
+
+    async def connect(self, timeout: float = 10):
+        """Open the shared websocket if it is not already open."""
+        if self._ws is not None:
+            return
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._ws is not None:
+                return
+            self._loop = asyncio.get_running_loop()
+            url = f"ws://{self.server_address}/ws?clientId={self.client_id}"
+            ws = await asyncio.to_thread(create_connection, url, timeout=timeout)
+            ws.settimeout(None)
+            self._ws = ws
+            threading.Thread(target=self._reader, args=(ws,), daemon=True).start()
+
+    async def close(self):
+        """Close the shared websocket, failing any prompts still in flight."""
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            await asyncio.to_thread(ws.close)
+        self._fail_all(ComfyUnavailable("ComfyUI connection closed"))
+
+    def _reader(self, ws):
+        """Background thread: forward every websocket frame to the event loop."""
+        try:
+            while True:
+                out = ws.recv()
+                if not ws.connected:
+                    raise ConnectionError("websocket closed")
+                self._loop.call_soon_threadsafe(self._on_message, out)
+        except Exception as e:
+            try:
+                self._loop.call_soon_threadsafe(self._on_disconnect, ws, e)
+            except RuntimeError:
+                pass  # Event loop already closed
+
+    def _on_disconnect(self, ws, error: Exception):
+        if self._ws is ws:
+            self._ws = None
+            self._fail_all(ComfyUnavailable(f"Lost connection to ComfyUI: {error}"))
+
+    def _fail_all(self, error: Exception):
+        for tracker in self._trackers.values():
+            tracker.fail(error)
+        self._executing = None
+
+    def _tracker(self, prompt_id: str):
+        """The tracker of a prompt submitted here and still running, else None."""
+        tracker = self._trackers.get(prompt_id)
+        if tracker is None or tracker.future.done():
+            return None
+        return tracker
+
+    def _on_message(self, out):
+        if isinstance(out, str):
+            try:
+                message = json.loads(out)
+            except ValueError:
+                return
+            if not isinstance(message, dict):
+                return
+            msg_type = message.get("type")
+            data = message.get("data") or {}
+            if not isinstance(data, dict):
+                return
+            if msg_type == "status":
+                exec_info = (data.get("status") or {}).get("exec_info") or {}
+                self._queue_remaining = exec_info.get("queue_remaining")
+                self._publish_queue()
+                return
+            prompt_id = data.get("prompt_id")
+            if prompt_id is None:
+                return
+            tracker = self._tracker(prompt_id)
+            if tracker is None:
+                # Unknown or finished prompt: late messages are dropped
+                # rather than tracked again
+                if msg_type == "executing":
+                    self._executing = None
+                return
+
+            if msg_type == "executing":
+                tracker.current_node = data.get("node")
+                if tracker.started is None:
+                    tracker.started = time.perf_counter()
+                    self._publish_queue()
+                if tracker.current_node == OUTPUT_NODE:
+                    tracker.output_started = time.perf_counter()
+                if tracker.current_node is None:
+                    self._executing = None
+                    tracker.finish()
+                else:
+                    self._executing = prompt_id
+                    tracker.emit("executing", node=tracker.current_node)
+            elif msg_type == "progress":
+                tracker.emit(
+                    "progress", node=data.get("node"), value=data.get("value"), max=data.get("max")
+                )
+            elif msg_type in ("execution_error", "execution_interrupted"):
+                detail = data.get("exception_message", msg_type)
+                tracker.fail(ComfyError(f"ComfyUI execution failed: {detail}"))
+        elif self._executing is not None:
+            # Binary frames carry no prompt_id; ComfyUI runs one prompt at a
+            # time, so they belong to whichever prompt is executing
+            tracker = self._tracker(self._executing)
+            if tracker is None:
+                return
+            if tracker.current_node == OUTPUT_NODE:
+                tracker.images.setdefault(tracker.current_node, []).append(out[8:])
+                COMFY_RECEIVED_BYTES.inc(len(out) - 8)
+            elif int.from_bytes(out[:4], "big") == PREVIEW_IMAGE:
+                # A sampler's latent preview; only the listener keeps it
+                tracker.emit("preview", data=out[8:])
+
+    def _publish_queue(self):
+        """
+        Tell each waiting prompt how many of this client's prompts are ahead
+        of it. ComfyUI runs its queue in order, but prompts other clients
+        queued aren't known here; `remaining` is ComfyUI's whole queue.
+        """
+        waiting = sorted(
+            (tracker for tracker in self._trackers.values() if tracker.queued is not None and tracker.started is None),
+            key=lambda tracker: tracker.queued,
+        )
+        for position, tracker in enumerate(waiting):
+            tracker.emit("queue", position=position, remaining=self._queue_remaining)
+
+    def _post_prompt(self, prompt: dict, prompt_id: str) -> dict:
+        data = json.dumps({"prompt": prompt, "client_id": self.client_id, "prompt_id": prompt_id}).encode("utf-8")
+        req = urllib.request.Request(f"http://{self.server_address}/prompt", data=data)
+        try:
+            with urllib.request.urlopen(req, timeout=SUBMIT_TIMEOUT) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code != 400:
+                raise
+            # ComfyUI explains why the prompt is invalid in the body
+            try:
+                return json.loads(e.read())
+            except ValueError:
+                return {"error": e.reason}
+
+    def _get_queue(self, timeout: float) -> dict:
+        with urllib.request.urlopen(f"http://{self.server_address}/queue", timeout=timeout) as response:
+            return json.loads(response.read())
+
+    async def queue_depth(self, timeout: float = 5) -> int:
+        """Number of prompts running or waiting on the server, all clients included."""
+        queue = await asyncio.to_thread(self._get_queue, timeout)
+        return len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+
+    async def queue_prompt(self, prompt: dict, listener=None) -> str:
+        """
+        Submit a workflow to ComfyUI and return its prompt_id. `listener`,
+        if given, is called on the event loop as `listener(kind, **data)`
+        with the prompt's progress: "queue" (position, remaining),
+        "executing" (node), "progress" (node, value, max) and "preview"
+        (data, the encoded frame).
+        """
+        try:
+            await self.connect()
+        except Exception as e:
+            raise ComfyUnavailable(f"Can't connect to ComfyUI at {self.server_address}: {e}")
+        # The prompt_id is chosen here so the tracker exists before any of
+        # the prompt's messages can arrive, even ahead of the response
+        prompt_id = str(uuid.uuid4())
+        tracker = self._trackers[prompt_id] = _PromptTracker(self._loop)
+        tracker.listener = listener
+        try:
+            with COMFY_PHASE_SECONDS.time(phase="submit"):
+                result = await asyncio.to_thread(self._post_prompt, prompt, prompt_id)
+            if "prompt_id" not in result:
+                raise ComfyRejected(f"ComfyUI rejected the prompt: {result}")
+        except BaseException:
+            self._trackers.pop(prompt_id, None)
+            raise
+        if result["prompt_id"] != prompt_id:
+            # Servers predating client-chosen IDs assign their own
+            del self._trackers[prompt_id]
+            prompt_id = result["prompt_id"]
+            self._trackers[prompt_id] = tracker
+        tracker.queued = time.perf_counter()
+        # Execution may already have started before the response arrived
+        if tracker.started is not None:
+            tracker.started = tracker.queued
+            if tracker.current_node is not None:
+                tracker.emit("executing", node=tracker.current_node)
+        else:
+            self._publish_queue()
+        return prompt_id
+
+    async def wait_for_images(self, prompt_id: str) -> dict:
+        """Wait for a queued prompt to finish and return its images by node ID."""
+        tracker = self._trackers.get(prompt_id)
+        if tracker is None:
+            raise ComfyError(f"Prompt {prompt_id} isn't in flight")
+        if self._ws is None:
+            tracker.fail(ComfyUnavailable("Not connected to ComfyUI"))
+        try:
+            images = await tracker.future
+            tracker.observe_phases()
+            return images
+        finally:
+            self._trackers.pop(prompt_id, None)
+
+    async def generate(self, prompt: dict) -> dict:
+        """Queue a workflow and wait for its output images."""
+        prompt_id = await self.queue_prompt(prompt)
+        return await self.wait_for_images(prompt_id)
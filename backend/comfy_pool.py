@@ -0,0 +1,142 @@
+# comfy_pool.py
+import asyncio
+
+from comfy import ComfyClient, ComfyError, ComfyRejected, ComfyUnavailable
+from constants import SERVER_ADDRESSES
+
+HEALTH_INTERVAL = 5.0  # Seconds between health checks of each backend
+HEALTH_TIMEOUT = 3.0
+EJECT_AFTER = 2  # Consecutive failed health checks before a backend is taken out
+MAX_ATTEMPTS = 3  # Backends a prompt is tried on before its job fails
+
+
+class Backend:
+    """One ComfyUI server in the pool and what is known of its load."""
+
+    def __init__(self, client: ComfyClient):
+        self.client = client
+        self.healthy = True
+        self.failures = 0  # Consecutive failed health checks
+        self.in_flight = 0  # Prompts this pool is waiting on
+        self.queue_depth = 0  # From the last health check
+
+    @property
+    def address(self) -> str:
+        return self.client.server_address
+
+    @property
+    def load(self) -> int:
+        # Status messages keep the queue length current between health
+        # checks; prompts just submitted may not be counted in it yet
+        remaining = self.client.queue_remaining
+        return max(self.queue_depth if remaining is None else remaining, self.in_flight)
+
+    def to_dict(self) -> dict:
+        return {
+            "address": self.address,
+            "healthy": self.healthy,
+            "connected": self.client.connected,
+            "in_flight": self.in_flight,
+            "queue_depth": self.load,
+        }
+
+
+class ComfyPool:
+    """
+    Dispatches prompts across several ComfyUI servers. Each prompt goes to
+    the healthy backend with the shortest queue. Backends are health
+    checked in the background: one that fails checks or drops a prompt's
+    connection is taken out of rotation until it answers again, and the
+    prompt is retried on another backend.
+    """
+
+    def __init__(self, addresses: list = SERVER_ADDRESSES, health_interval: float = HEALTH_INTERVAL):
+        if not addresses:
+            raise ValueError("At least one ComfyUI address is required")
+        self.backends = [Backend(ComfyClient(address)) for address in addresses]
+        self.health_interval = health_interval
+        self._health_task = None
+
+    @property
+    def connected(self) -> bool:
+        return any(backend.client.connected for backend in self.backends)
+
+    def status(self) -> list:
+        return [backend.to_dict() for backend in self.backends]
+
+    def start(self):
+        """Start health checking. Must be called on the event loop."""
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._check_health())
+
+    def choose(self, exclude=()) -> Backend:
+        """The least loaded healthy backend not in `exclude`, the first one on ties."""
+        candidates = [backend for backend in self.backends if backend not in exclude]
+        healthy = [backend for backend in candidates if backend.healthy]
+        # With nothing known to be healthy, trying one beats failing outright
+        candidates = healthy or candidates
+        if not candidates:
+            raise ComfyUnavailable("No ComfyUI backend available")
+        return min(candidates, key=lambda backend: backend.load)
+
+    def _eject(self, backend: Backend, error: Exception):
+        if backend.healthy:
+            print(f"Taking ComfyUI backend {backend.address} out of rotation: {error}")
+        backend.healthy = False
+
+    async def run(self, prompt: dict, listener=None, on_queued=None) -> dict:
+        """
+        Run a workflow on the least loaded backend and return its images by
+        node ID, retrying on another backend if it fails there. `listener`
+        receives the prompt's progress (see ComfyClient.queue_prompt) and a
+        "retry" event before each retry; `on_queued` is called with each
+        prompt_id once the prompt is queued.
+        """
+        tried = []
+        error = None
+        for attempt in range(min(MAX_ATTEMPTS, len(self.backends))):
+            backend = self.choose(tried)
+            tried.append(backend)
+            if error is not None and listener is not None:
+                listener("retry", attempt=attempt, backend=backend.address, error=str(error))
+            backend.in_flight += 1
+            try:
+                prompt_id = await backend.client.queue_prompt(prompt, listener)
+                if on_queued is not None:
+                    on_queued(prompt_id)
+                return await backend.client.wait_for_images(prompt_id)
+            except ComfyRejected:
+                raise
+            except (ComfyUnavailable, OSError) as e:
+                self._eject(backend, e)
+                error = e
+            except ComfyError as e:
+                error = e  # An execution failure may not recur elsewhere
+            finally:
+                backend.in_flight -= 1
+        raise error
+
+    async def _check_health(self):
+        while True:
+            await asyncio.gather(*(self._probe(backend) for backend in self.backends))
+            await asyncio.sleep(self.health_interval)
+
+    async def _probe(self, backend: Backend):
+        try:
+            backend.queue_depth = await backend.client.queue_depth(HEALTH_TIMEOUT)
+        except Exception as e:
+            backend.failures += 1
+            if backend.failures >= EJECT_AFTER:
+                self._eject(backend, e)
+            return
+        backend.failures = 0
+        if not backend.healthy:
+            print(f"ComfyUI backend {backend.address} is back in rotation")
+            backend.healthy = True
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for backend in self.backends:
+            await backend.client.close()
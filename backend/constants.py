@@ -1,12 +1,49 @@
 # constants.py
+import os
 import uuid
 
 # Constants
-SERVER_ADDRESS = "127.0.0.1:8188"
+# ComfyUI servers to dispatch to; set COMFYUI_ADDRESSES to a comma-separated list
+SERVER_ADDRESSES = [
+    address.strip() for address in os.environ.get("COMFYUI_ADDRESSES", "127.0.0.1:8188").split(",") if address.strip()
+]
+SERVER_ADDRESS = SERVER_ADDRESSES[0]
 CLIENT_ID = str(uuid.uuid4())
 IMAGES_FOLDER = "./public/images"
+OBJECTS_FOLDER = "./public/objects"  # Image content by SHA-256; IMAGES_FOLDER holds links to it
 THUMBNAILS_FOLDER = "./public/thumbnails"
+THUMBNAIL_CACHE_FOLDER = "./public/thumbnail_cache"  # Resized/re-encoded thumbnail variants
+THUMBNAIL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+IMAGE_INDEX_PATH = "./public/images.db"  # SQLite index of image metadata
 PROMPT_TEMPLATE_PATH = "./default/prompt.json"  # Path to the prompt JSON template
+WORKFLOWS_FOLDER = "./default/workflows"  # Additional named workflow templates
 DELETED_TAGS_FILE = "./public/tags/deleted_tags.json"
 PUBLIC_TAGS_FOLDER = "./public/tags"
-DEFAULT_TAGS_FOLDER = "./default/tags"
\ No newline at end of file
+DEFAULT_TAGS_FOLDER = "./default/tags"
+SNAPSHOTS_FOLDER = "./public/snapshots"  # Saved versions of the public tag files
+TAG_INDEX_CACHE_FOLDER = "./public/tag_index"  # Compiled, memory-mappable tag indexes
+
+# Set SLOW_REQUEST_SECONDS to record stack samples of requests slower than it
+SLOW_REQUEST_SECONDS = float(os.environ["SLOW_REQUEST_SECONDS"]) if os.environ.get("SLOW_REQUEST_SECONDS") else None
+# Set PERCEPTUAL_HASHING=0 to skip hashing images for near-duplicate grouping
+PERCEPTUAL_HASHING = os.environ.get("PERCEPTUAL_HASHING", "1") != "0"
+SHUTDOWN_DRAIN_SECONDS = 300  # How long shutdown waits for running generation jobs
+MAX_BATCH_SIZE = 500  # Prompts one batch request may expand to
+
+# Tag category name -> tag file name
+TAG_FILES = {
+    "artist": "artist.json",
+    "character": "char.json",
+    "danbooru": "danbooru.json",
+    "participant": "participant.json",
+}
+
+# Node inputs patched per request, by workflow name. Workflows without an
+# entry here use the "default" bindings.
+WORKFLOW_BINDINGS = {
+    "default": {
+        "positive": [("73", "text")],
+        "negative": [("74", "text")],
+        "seed": [("99", "seed"), ("106", "seed")],
+    },
+}
@@ -0,0 +1,125 @@
+# content_store.py
+import os
+import shutil
+import threading
+
+from constants import OBJECTS_FOLDER
+from image_index import image_index
+
+
+class ContentStore:
+    """
+    Image files stored once each, named by their SHA-256, under
+    OBJECTS_FOLDER. Gallery names in the images folder are hard links to
+    these objects, so identical images share one copy on disk and a name
+    can be added or removed without touching the content. Filesystems
+    without hard links fall back to plain copies.
+
+    An object is in use while an indexed image has its hash or a name still
+    links to it; link counts alone miss names that had to be copies.
+    """
+
+    def __init__(self, folder: str = OBJECTS_FOLDER):
+        self.folder = folder
+        self._lock = threading.Lock()
+
+    def path(self, content_hash: str) -> str:
+        return os.path.join(self.folder, content_hash[:2], f"{content_hash}.png")
+
+    def put(self, data: bytes, content_hash: str) -> bool:
+        """Store bytes under their hash. Returns False if they were already stored."""
+        path = self.path(content_hash)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        try:
+            # Linking, unlike a rename, fails if a concurrent save got there first
+            os.link(temp_path, path)
+        except FileExistsError:
+            return False
+        except OSError:
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return True
+
+    def link(self, content_hash: str, alias_path: str):
+        """
+        Create `alias_path` as a name for a stored object. Raises
+        FileExistsError if the name is taken.
+        """
+        source = self.path(content_hash)
+        with self._lock:
+            try:
+                os.link(source, alias_path)
+                return
+            except (FileExistsError, FileNotFoundError):
+                raise
+            except OSError:
+                pass
+            with open(source, "rb") as src, open(alias_path, "xb") as dst:
+                shutil.copyfileobj(src, dst)
+
+    def adopt(self, alias_path: str, content_hash: str):
+        """
+        Bring an image that was written straight to the images folder into
+        the store, replacing it with a link if its content is already stored.
+        """
+        path = self.path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            try:
+                os.link(alias_path, path)
+                return
+            except FileExistsError:
+                pass
+            except OSError:
+                return  # No hard links: leave the file as it is
+            if os.path.samefile(alias_path, path):
+                return
+            temp_path = f"{alias_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            os.link(path, temp_path)
+            os.replace(temp_path, alias_path)
+
+    def release(self, content_hash: str) -> bool:
+        """Remove an object once nothing uses it. Returns whether it was removed."""
+        if image_index.count_by_hash(content_hash):
+            return False
+        return self._remove_unlinked(content_hash)
+
+    def _remove_unlinked(self, content_hash: str) -> bool:
+        path = self.path(content_hash)
+        with self._lock:
+            try:
+                if os.stat(path).st_nlink > 1:
+                    return False
+                os.remove(path)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def collect(self) -> int:
+        """Remove every object nothing uses, e.g. after files were deleted outside the app."""
+        removed = 0
+        if not os.path.isdir(self.folder):
+            return removed
+        referenced = image_index.content_hashes()
+        for shard in os.scandir(self.folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                content_hash = entry.name[:-4]
+                if (
+                    entry.name.endswith(".png")
+                    and content_hash not in referenced
+                    and self._remove_unlinked(content_hash)
+                ):
+                    removed += 1
+        return removed
+
+
+content_store = ContentStore()
@@ -0,0 +1,110 @@
+# duplicates.py
+import os
+import asyncio
+
+from constants import IMAGES_FOLDER, PERCEPTUAL_HASHING
+from content_store import content_store
+from image_index import image_index, hash_file
+from thumbnails import compute_perceptual_hash
+
+HASH_BITS = 64
+BACKFILL_BATCH = 100
+BACKFILL_INTERVAL = 30.0  # Seconds between checks for images still to hash
+
+
+def _chunks(value: int, count: int) -> list:
+    """Split a hash into `count` bit ranges of near-equal width."""
+    chunks, start = [], 0
+    for i in range(count):
+        width = HASH_BITS // count + (i < HASH_BITS % count)
+        chunks.append((value >> start) & ((1 << width) - 1))
+        start += width
+    return chunks
+
+
+def group_duplicates(hashes: list, distance: int = 0) -> list:
+    """
+    Group the (filename, content_hash, phash) rows of identical images and,
+    when `distance` is set, of images whose perceptual hashes differ in at
+    most that many bits. Returns groups of two or more filenames, largest
+    first.
+    """
+    parent = list(range(len(hashes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        parent[find(i)] = find(j)
+
+    by_content = {}
+    for i, (_, content_hash, _) in enumerate(hashes):
+        if content_hash:
+            union(i, by_content.setdefault(content_hash, i))
+
+    if distance:
+        # Hashes within `distance` bits agree exactly on at least one of
+        # distance + 1 chunks, so only hashes sharing a chunk are compared
+        values = [(i, int(phash, 16)) for i, (_, _, phash) in enumerate(hashes) if phash]
+        buckets = {}
+        for i, value in values:
+            for position, chunk in enumerate(_chunks(value, distance + 1)):
+                buckets.setdefault((position, chunk), []).append((i, value))
+        for bucket in buckets.values():
+            for a in range(len(bucket)):
+                i, value = bucket[a]
+                for j, other in bucket[a + 1:]:
+                    if find(i) != find(j) and bin(value ^ other).count("1") <= distance:
+                        union(i, j)
+
+    groups = {}
+    for i, (filename, _, _) in enumerate(hashes):
+        groups.setdefault(find(i), []).append(filename)
+    return sorted((group for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+
+async def hash_image(filename: str):
+    """
+    Record an image's content hash, and perceptual hash if enabled, moving
+    its file into the content store. An image that can't be read, or whose
+    file is gone, is recorded with empty hashes so the backfill moves past
+    it; the folder watcher drops the rows of deleted files.
+    """
+    path = os.path.join(IMAGES_FOLDER, filename)
+    try:
+        content_hash = await asyncio.to_thread(hash_file, path)
+        await asyncio.to_thread(content_store.adopt, path, content_hash)
+    except OSError as e:
+        print(f"Failed to hash {filename}: {e}")
+        await asyncio.to_thread(image_index.set_hashes, filename, "", "")
+        return
+    phash = None
+    if PERCEPTUAL_HASHING:
+        try:
+            phash = await compute_perceptual_hash(path)
+        except Exception:
+            phash = ""  # Not decodable; don't try again
+    await asyncio.to_thread(image_index.set_hashes, filename, content_hash, phash)
+
+
+async def backfill_hashes(interval: float = BACKFILL_INTERVAL):
+    """
+    Background task: hash images indexed without hashes (added outside the
+    app or before content addressing) and drop stored objects no image
+    links to any more.
+    """
+    await asyncio.to_thread(content_store.collect)
+    while True:
+        try:
+            while True:
+                filenames = await asyncio.to_thread(image_index.missing_hashes, PERCEPTUAL_HASHING, BACKFILL_BATCH)
+                for filename in filenames:
+                    await hash_image(filename)
+                if len(filenames) < BACKFILL_BATCH:
+                    break
+        except Exception as e:
+            print(f"Error hashing images: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,91 @@
+# events.py
+import json
+import asyncio
+from collections import deque
+
+HISTORY_SIZE = 1000  # Events kept for clients resuming with Last-Event-ID
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_INTERVAL = 15.0
+
+
+class EventBroker:
+    """
+    Fans gallery change events out to connected clients. Each subscriber
+    has a bounded queue; a client too slow to keep up is sent a single
+    "resync" event instead of an ever-growing backlog.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._subscribers = set()
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._next_id = 1
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def publish(self, event_type: str, **data):
+        """Publish an event. Safe to call from worker threads."""
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        event = {"type": event_type, **data}
+        if running is self._loop:
+            self._publish(event)
+        else:
+            self._loop.call_soon_threadsafe(self._publish, event)
+
+    def _publish(self, event: dict):
+        event["id"] = self._next_id
+        self._next_id += 1
+        self._history.append(event)
+        for queue in self._subscribers:
+            self._offer(queue, event)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: dict):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Drop the backlog; the client reloads its listing instead
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "resync", "id": event["id"]})
+
+    def subscribe(self, last_event_id: int = None) -> asyncio.Queue:
+        """Register a subscriber, replaying events after `last_event_id`."""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        if last_event_id is not None:
+            oldest = self._history[0]["id"] if self._history else self._next_id
+            if last_event_id < oldest - 1:
+                queue.put_nowait({"type": "resync", "id": self._next_id - 1})
+            else:
+                for event in self._history:
+                    if event["id"] > last_event_id:
+                        self._offer(queue, event)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    async def stream(self, last_event_id: int = None):
+        """Yield events as Server-Sent Events, with periodic heartbeats."""
+        queue = self.subscribe(last_event_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"id: {event['id']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+
+event_broker = EventBroker()
@@ -0,0 +1,417 @@
+# image_index.py
+import os
+import json
+import time
+import base64
+import hashlib
+import sqlite3
+import threading
+from typing import List, Optional, Union
+
+from constants import IMAGES_FOLDER, IMAGE_INDEX_PATH
+from http_cache import versioned_url
+from metrics import IMAGE_INDEX_SECONDS
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    filename TEXT PRIMARY KEY,
+    character TEXT NOT NULL DEFAULT '',
+    artist TEXT NOT NULL DEFAULT '',
+    character_key TEXT NOT NULL DEFAULT '',
+    artist_key TEXT NOT NULL DEFAULT '',
+    positive_clip TEXT,
+    negative_clip TEXT,
+    workflow TEXT,
+    seeds TEXT,
+    width INTEGER,
+    height INTEGER,
+    file_size INTEGER,
+    created REAL NOT NULL,
+    content_hash TEXT,
+    phash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_images_character ON images (character_key, created);
+CREATE INDEX IF NOT EXISTS idx_images_artist ON images (artist_key, created);
+CREATE INDEX IF NOT EXISTS idx_images_created ON images (created);
+"""
+
+COLUMNS = (
+    "filename", "character", "artist", "positive_clip", "negative_clip",
+    "workflow", "seeds", "width", "height", "file_size", "created", "content_hash", "phash",
+)
+
+# Columns added after the first schema version, with their definitions
+MIGRATIONS = {
+    "content_hash": "TEXT",
+    "phash": "TEXT",
+}
+
+# Indexes on migrated columns, created once the columns exist
+MIGRATION_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_images_content_hash ON images (content_hash);
+"""
+
+
+def png_dimensions(data: bytes):
+    """Read (width, height) from a PNG's IHDR chunk without decoding it."""
+    if data[:8] != PNG_SIGNATURE or len(data) < 24:
+        return None, None
+    return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+
+
+def parse_image_filename(filename: str, known_artists=()) -> tuple:
+    """
+    Split a `{character}_{artist}_{n}.png` name into (character, artist).
+    Both parts may contain underscores, so the split point is the one whose
+    suffix is a known artist name. Without one the split is unknown and both
+    are empty; filters match such images on their filename instead.
+    """
+    stem = os.path.splitext(filename)[0]
+    name, _, index = stem.rpartition("_")
+    if not name or not index.isdigit():
+        name = stem
+    positions = [i for i, char in enumerate(name) if char == "_"]
+    for i in positions:
+        if name[i + 1:] in known_artists:
+            return name[:i], name[i + 1:]
+    return "", ""
+
+
+# Sort name -> (key columns, direction). Every key ends with the unique
+# filename so the order is total and usable as a pagination cursor.
+SORT_ORDERS = {
+    "newest": (("created", "filename"), "DESC"),
+    "oldest": (("created", "filename"), "ASC"),
+    "name": (("filename",), "ASC"),
+    "artist": (("artist_key", "created", "filename"), "ASC"),
+}
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort: str) -> list:
+    """Decode a pagination cursor, checking it matches the sort order's keys."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(SORT_ORDERS[sort][0]):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_entry(record: dict) -> dict:
+    """Build the client-facing listing entry for an image record."""
+    filename = record["filename"]
+    content_hash = record.get("content_hash")
+    # Missing thumbnails are backfilled when first requested
+    return {
+        "original": versioned_url(f"/images/{filename}", content_hash),
+        "thumbnail": versioned_url(f"/thumb/{filename}", content_hash),
+        "title": filename.split(".")[0],
+    }
+
+
+# A character/artist filter: one prefix or several, any of which may match
+Filter = Union[str, List[str], None]
+
+
+def _prefix_range(value: str) -> tuple:
+    """Index range covering every key that starts with `value`."""
+    key = value.lower()
+    return key, key + "\U0010ffff"
+
+
+def _like_pattern(value: str) -> str:
+    """LIKE pattern matching `value` anywhere, with its wildcards escaped."""
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _prefix_clause(column: str, values) -> tuple:
+    """
+    Match `column` against any of the prefixes in `values`, a string or a
+    list of them. Rows whose filename couldn't be split have an empty key
+    and are matched by substring on the filename instead.
+    """
+    prefixes = [value for value in ([values] if isinstance(values, str) else values or []) if value]
+    if not prefixes:
+        return None, []
+    params = []
+    for prefix in prefixes:
+        params.extend(_prefix_range(prefix))
+    params.extend(_like_pattern(prefix) for prefix in prefixes)
+    ranges = " OR ".join(f"{column} >= ? AND {column} < ?" for _ in prefixes)
+    likes = " OR ".join("filename LIKE ? ESCAPE '\\'" for _ in prefixes)
+    return f"({ranges} OR ({column} = '' AND ({likes})))", params
+
+
+class ImageIndex:
+    """SQLite index of the image library's metadata."""
+
+    def __init__(self, path: str = IMAGE_INDEX_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        with self._init_lock:
+            if self._conn is not None:
+                return self._conn
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+            for column, definition in MIGRATIONS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE images ADD COLUMN {column} {definition}")
+            conn.executescript(MIGRATION_INDEXES)
+            conn.commit()
+            self._conn = conn
+            return conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def _record(filename: str, character: str = "", artist: str = "", **metadata) -> dict:
+        record = {column: metadata.get(column) for column in COLUMNS}
+        record.update(filename=filename, character=character or "", artist=artist or "")
+        if isinstance(record["seeds"], (list, tuple)):
+            record["seeds"] = json.dumps(record["seeds"])
+        if record["created"] is None:
+            record["created"] = time.time()
+        record["character_key"] = record["character"].lower()
+        record["artist_key"] = record["artist"].lower()
+        return record
+
+    def _insert(self, records: list):
+        if not records:
+            return
+        columns = ", ".join(records[0])
+        placeholders = ", ".join(f":{column}" for column in records[0])
+        with self._lock, self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO images ({columns}) VALUES ({placeholders})", records)
+
+    def add(self, filename: str, character: str = "", artist: str = "", **metadata):
+        """Insert or replace the record for an image."""
+        self._insert([self._record(filename, character, artist, **metadata)])
+
+    def remove(self, filename: str):
+        self.remove_many([filename])
+
+    def remove_many(self, filenames: list):
+        """Drop the records of several images in one transaction."""
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM images WHERE filename = ?", [(name,) for name in filenames])
+
+    def get(self, filename: str) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM images WHERE filename = ?", (filename,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def get_many(self, filenames: list) -> dict:
+        """Records of the given images that are indexed, by filename."""
+        records = {}
+        names = list(dict.fromkeys(filenames))
+        with self._lock:
+            # Batched to stay under SQLite's limit on query parameters
+            for start in range(0, len(names), 500):
+                batch = names[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT * FROM images WHERE filename IN ({', '.join('?' for _ in batch)})", batch
+                ).fetchall()
+                records.update((row["filename"], self._to_dict(row)) for row in rows)
+        return records
+
+    def content_hash(self, filename: str, path: str) -> str:
+        """
+        Return the SHA-256 of an image's content. Images indexed before
+        hashes were recorded are hashed on first use and the result stored.
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT content_hash FROM images WHERE filename = ?", (filename,)).fetchone()
+        if row is not None and row[0]:
+            return row[0]
+        digest = hash_file(path)
+        if row is not None:
+            with self._lock, self.conn:
+                self.conn.execute("UPDATE images SET content_hash = ? WHERE filename = ?", (digest, filename))
+        return digest
+
+    def find_by_hash(self, content_hash: str) -> Optional[dict]:
+        """Return the oldest image with this content, if any."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM images WHERE content_hash = ? ORDER BY created LIMIT 1", (content_hash,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def missing_hashes(self, perceptual: bool, limit: int = 100) -> list:
+        """Filenames of images still lacking a content hash, or a perceptual one if wanted."""
+        condition = "content_hash IS NULL OR phash IS NULL" if perceptual else "content_hash IS NULL"
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT filename FROM images WHERE {condition} ORDER BY created LIMIT ?", (limit,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def set_hashes(self, filename: str, content_hash: str, phash: Optional[str] = None):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE images SET content_hash = ?, phash = COALESCE(?, phash) WHERE filename = ?",
+                (content_hash, phash, filename),
+            )
+
+    def count_by_hash(self, content_hash: str) -> int:
+        """Number of images with this content."""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM images WHERE content_hash = ?", (content_hash,)).fetchone()[0]
+
+    def content_hashes(self) -> set:
+        """Every content hash some image has."""
+        with self._lock:
+            rows = self.conn.execute("SELECT DISTINCT content_hash FROM images WHERE content_hash IS NOT NULL").fetchall()
+        return {row[0] for row in rows}
+
+    def hashes(self) -> list:
+        """(filename, content_hash, phash) for every image, oldest first."""
+        with self._lock:
+            return self.conn.execute("SELECT filename, content_hash, phash FROM images ORDER BY created").fetchall()
+
+    @staticmethod
+    def _filters(character: Filter, artist: Filter) -> tuple:
+        clauses, params = [], []
+        for column, values in (("character_key", character), ("artist_key", artist)):
+            clause, clause_params = _prefix_clause(column, values)
+            if clause:
+                clauses.append(clause)
+                params.extend(clause_params)
+        return clauses, params
+
+    def query(self, character: Filter = None, artist: Filter = None) -> list:
+        """
+        Return image records, oldest first, whose character and artist start
+        with the given filters (case-insensitive). A list of filters matches
+        any of them.
+        """
+        records, _ = self.page(character, artist, sort="oldest")
+        return records
+
+    def page(
+        self,
+        character: Filter = None,
+        artist: Filter = None,
+        sort: str = "newest",
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> tuple:
+        """
+        Return one page of filtered records in `sort` order, plus the cursor
+        for the next page (None on the last page). Pages are keyset based,
+        so they stay stable while images are added or deleted.
+        """
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"Unknown sort order: {sort}")
+        keys, direction = SORT_ORDERS[sort]
+        clauses, params = self._filters(character, artist)
+
+        if cursor:
+            values = decode_cursor(cursor, sort)
+            comparison = "<" if direction == "DESC" else ">"
+            clauses.append(f"({', '.join(keys)}) {comparison} ({', '.join('?' for _ in keys)})")
+            params.extend(values)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = ", ".join(f"{key} {direction}" for key in keys)
+        sql = f"SELECT * FROM images {where} ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        with self._lock, IMAGE_INDEX_SECONDS.time(operation="page"):
+            rows = self.conn.execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][key] for key in keys])
+        return [self._to_dict(row) for row in rows], next_cursor
+
+    def count(self, character: Filter = None, artist: Filter = None) -> int:
+        clauses, params = self._filters(character, artist)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock, IMAGE_INDEX_SECONDS.time(operation="count"):
+            return self.conn.execute(f"SELECT COUNT(*) FROM images {where}", params).fetchone()[0]
+
+    def sync(self, folder: str = IMAGES_FOLDER, known_artists=()) -> tuple:
+        """
+        Reconcile the index with the images folder: index PNGs that were added
+        outside the app and drop records whose files are gone. Returns the
+        added records and the removed filenames.
+        """
+        with IMAGE_INDEX_SECONDS.time(operation="sync"):
+            return self._sync(folder, known_artists)
+
+    def _sync(self, folder: str, known_artists) -> tuple:
+        on_disk = {}
+        for entry in os.scandir(folder):
+            if entry.name.endswith(".png") and entry.is_file():
+                on_disk[entry.name] = entry
+        with self._lock:
+            indexed = {row[0] for row in self.conn.execute("SELECT filename FROM images")}
+
+        missing = indexed - on_disk.keys()
+        if missing:
+            with self._lock, self.conn:
+                self.conn.executemany("DELETE FROM images WHERE filename = ?", [(name,) for name in missing])
+
+        records = []
+        for filename in on_disk.keys() - indexed:
+            stat = on_disk[filename].stat()
+            with open(on_disk[filename].path, "rb") as file:
+                width, height = png_dimensions(file.read(24))
+            character, artist = parse_image_filename(filename, known_artists)
+            records.append(self._record(
+                filename, character, artist,
+                width=width, height=height, file_size=stat.st_size, created=stat.st_mtime,
+            ))
+        self._insert(records)
+        return [self._to_dict(record) for record in records], sorted(missing)
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        record = dict(row)
+        record.pop("character_key", None)
+        record.pop("artist_key", None)
+        if record.get("seeds"):
+            record["seeds"] = json.loads(record["seeds"])
+        return record
+
+
+image_index = ImageIndex()
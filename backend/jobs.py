@@ -0,0 +1,251 @@
+# jobs.py
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+
+from comfy_pool import ComfyPool
+from metrics import Gauge
+from progress import JobProgress
+from models import Prompt, BatchPrompt
+from utils import save_image
+from workflows import build_prompt_workflow, workflow_registry
+
+MAX_FINISHED_JOBS = 500  # Finished jobs kept around for status/result lookups
+MAX_FINISHED_BATCHES = 50
+MAX_IN_FLIGHT_PROMPTS = 8  # Prompts submitted to ComfyUI but not yet finished
+
+
+class Job:
+    """A single generation request and its outcome."""
+
+    def __init__(self, prompt: Prompt):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.status = "pending"
+        self.prompt_id = None
+        self.titles = []
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.task = None
+        self.limiters = []
+        self.progress = JobProgress()
+        self.progress.publish("status", status=self.status)
+
+    def set_status(self, status: str):
+        self.status = status
+        self.progress.publish("status", status=status)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "prompt_id": self.prompt_id,
+            "titles": self.titles,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class Batch:
+    """A group of jobs submitted together."""
+
+    def __init__(self, jobs: list):
+        self.id = uuid.uuid4().hex
+        self.jobs = jobs
+        self.created = time.time()
+
+    @property
+    def done(self) -> bool:
+        return all(job.done for job in self.jobs)
+
+    def to_dict(self) -> dict:
+        counts = {}
+        for job in self.jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "batch_id": self.id,
+            "status": "completed" if self.done else "running",
+            "total": len(self.jobs),
+            "counts": counts,
+            "titles": [title for job in self.jobs for title in job.titles],
+            "jobs": [{"job_id": job.id, "status": job.status} for job in self.jobs],
+        }
+
+
+def batch_size(batch: BatchPrompt) -> int:
+    """How many prompts expand_batch will produce, without expanding them."""
+    combinations = 0
+    if batch.character_tags or batch.artist_tags:
+        combinations = max(len(batch.character_tags), 1) * max(len(batch.artist_tags), 1)
+    return (len(batch.prompts) + combinations) * batch.seed_count
+
+
+def expand_batch(batch: BatchPrompt) -> list:
+    """Expand a batch request into one Prompt per variation and seed."""
+    variations = list(batch.prompts)
+    if batch.character_tags or batch.artist_tags:
+        for character in batch.character_tags or [None]:
+            for artist in batch.artist_tags or [None]:
+                clip = batch.positive_clip
+                if "{character}" in clip or "{artist}" in clip:
+                    clip = clip.replace("{character}", character or "").replace("{artist}", artist or "")
+                else:
+                    clip = ", ".join(part for part in (character, artist, clip) if part)
+                variations.append(Prompt(
+                    positive_clip=clip,
+                    negative_clip=batch.negative_clip,
+                    workflow=batch.workflow,
+                    character_tags=[character] if character else [],
+                    artist_tags=[artist] if artist else [],
+                ))
+    # A pinned seed is stepped per run; otherwise each run draws its own
+    return [
+        variation if variation.seed is None else variation.model_copy(update={"seed": variation.seed + i})
+        for variation in variations
+        for i in range(batch.seed_count)
+    ]
+
+
+class JobManager:
+    """Runs generation jobs as asyncio tasks against a pool of ComfyUI servers."""
+
+    def __init__(self, client: ComfyPool, max_in_flight: int = MAX_IN_FLIGHT_PROMPTS):
+        self.client = client
+        self.jobs = OrderedDict()
+        self.batches = OrderedDict()
+        self.max_in_flight = max_in_flight
+        self.draining = False
+        self._in_flight = None
+
+    def submit(self, prompt: Prompt, limiters: list = ()) -> Job:
+        """Start a generation job and return it without waiting for it."""
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        job = Job(prompt)
+        job.limiters = [*limiters, self._in_flight]
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job))
+        self._prune()
+        return job
+
+    def submit_batch(self, prompts: list, max_in_flight: int = None) -> Batch:
+        """
+        Start a job per prompt. Every job is created up front and is queued
+        to ComfyUI as soon as an in-flight slot frees up, so ComfyUI's queue
+        stays fed; `max_in_flight` further limits this batch's share.
+        """
+        limiters = [asyncio.Semaphore(max_in_flight)] if max_in_flight else []
+        batch = Batch([self.submit(prompt, limiters) for prompt in prompts])
+        self.batches[batch.id] = batch
+        finished = [batch_id for batch_id, item in self.batches.items() if item.done]
+        for batch_id in finished[:max(0, len(finished) - MAX_FINISHED_BATCHES)]:
+            del self.batches[batch_id]
+        return batch
+
+    def get_batch(self, batch_id: str):
+        return self.batches.get(batch_id)
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    async def wait(self, job: Job) -> Job:
+        """Wait for a job to finish, without cancelling it if the caller goes away."""
+        await asyncio.shield(job.task)
+        return job
+
+    def in_flight(self) -> int:
+        return sum(1 for job in self.jobs.values() if not job.done)
+
+    def status_counts(self) -> dict:
+        """Number of unfinished jobs per status."""
+        counts = {status: 0 for status in ("pending", "queued", "running")}
+        for job in list(self.jobs.values()):
+            if not job.done:
+                counts[job.status] += 1
+        return counts
+
+    async def _run(self, job: Job):
+        try:
+            workflow = build_prompt_workflow(job.prompt)
+            async with AsyncExitStack() as stack:
+                for limiter in job.limiters:
+                    await stack.enter_async_context(limiter)
+                job.set_status("queued")
+
+                def on_queued(prompt_id):
+                    job.prompt_id = prompt_id
+                    job.set_status("running")
+
+                images = await self.client.run(workflow, job.progress.publish, on_queued)
+            metadata = {
+                "positive_clip": job.prompt.positive_clip,
+                "negative_clip": job.prompt.negative_clip,
+                "workflow": job.prompt.workflow,
+                "seeds": workflow_registry.get(job.prompt.workflow).seeds(workflow),
+            }
+            job.titles = await self._save_images(job.prompt, images, metadata)
+            job.status = "completed"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            if job.status == "completed":
+                job.progress.finish("completed", titles=job.titles)
+            else:
+                job.progress.finish("failed", error=job.error or "Job was cancelled")
+
+    async def _save_images(self, prompt: Prompt, images: dict, metadata: dict) -> list:
+        character = prompt.character_tags[0].split(",")[0] if prompt.character_tags else "char"
+        artist = prompt.artist_tags[0] if prompt.artist_tags else "artist"
+        titles = []
+        for node_id, image_data_list in images.items():
+            for image_data in image_data_list:
+                paths = await save_image(image_data, node_id, character, artist, metadata)
+                titles.append(os.path.basename(paths["original"]))
+        return titles
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Stop accepting jobs and wait up to `timeout` seconds for the ones
+        already submitted. Returns how many are still unfinished.
+        """
+        self.draining = True
+        tasks = [job.task for job in self.jobs.values() if not job.done and job.task is not None]
+        if not tasks:
+            return 0
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        return len(pending)
+
+    async def close(self):
+        await self.client.close()
+
+
+job_manager = JobManager(ComfyPool())
+
+GENERATION_JOBS = Gauge(
+    "generation_jobs_in_flight", "Unfinished generation jobs by status.", ("status",),
+    collect=lambda: job_manager.status_counts(),
+)
+COMFY_BACKEND_UP = Gauge(
+    "comfy_backend_up", "Whether each ComfyUI backend is in rotation.", ("backend",),
+    collect=lambda: {backend.address: int(backend.healthy) for backend in job_manager.client.backends},
+)
+COMFY_BACKEND_QUEUE_DEPTH = Gauge(
+    "comfy_backend_queue_depth", "Prompts queued or running on each ComfyUI backend.", ("backend",),
+    collect=lambda: {backend.address: backend.load for backend in job_manager.client.backends},
+)
@@ -1,5 +1,45 @@
 # main.py
+import argparse
 import uvicorn
 
+def main():
+    parser = argparse.ArgumentParser(description="Run the ComfyGallery backend.")
+    parser.add_argument("--production", action="store_true", help="Run without auto-reload, draining jobs on shutdown")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--compile-tags",
+        action="store_true",
+        help="Compile the tag files' search indexes and exit",
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=30,
+        help="Seconds to wait for open requests on shutdown; running jobs are drained after this",
+    )
+    args = parser.parse_args()
+
+    if args.compile_tags or args.production:
+        # Compile before serving so startup only has to map the indexes
+        from app import prepare_folders, compile_tag_indexes
+        prepare_folders()
+        compile_tag_indexes()
+        if args.compile_tags:
+            return
+
+    if args.production:
+        # A single process: generation jobs and live event streams are held
+        # in its memory, so they can't be split across workers
+        uvicorn.run(
+            "app:app",
+            host=args.host,
+            port=args.port,
+            timeout_graceful_shutdown=args.graceful_timeout,
+            log_level="info",
+        )
+    else:
+        uvicorn.run("app:app", host=args.host, port=args.port, reload=True)
+
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    main()
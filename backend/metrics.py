@@ -0,0 +1,226 @@
+# metrics.py
+import time
+import threading
+from contextlib import contextmanager
+
+# Seconds; spans fast tag lookups through slow generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PREFIX = "comfygallery_"
+
+_metrics = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """A named metric family; samples are keyed by their label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> list:
+        """(suffix, label string, value) triples for the exposition format."""
+        with self._lock:
+            items = list(self._values.items())
+        return [("", _format_labels(self.labelnames, key), value) for key, value in items]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. Gauges given a `collect` function are
+    read from it at scrape time instead; it returns {label values: value}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> list:
+        if self.collect is None:
+            return super()._samples()
+        try:
+            values = self.collect()
+        except Exception:
+            return []
+        return [
+            ("", _format_labels(self.labelnames, key if isinstance(key, tuple) else (key,)), value)
+            for key, value in values.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of a `with` block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> list:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        samples = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                samples.append(("_bucket", labels, cumulative))
+            samples.append(("_bucket", _format_labels(self.labelnames, key, 'le="+Inf"'), count))
+            samples.append(("_sum", _format_labels(self.labelnames, key), total))
+            samples.append(("_count", _format_labels(self.labelnames, key), count))
+        return samples
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _metrics) + "\n"
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being handled, including open streams.")
+COMFY_PHASE_SECONDS = Histogram(
+    "comfy_phase_duration_seconds",
+    "ComfyUI round-trip time per phase: submit, queued, executing and transfer.",
+    ("phase",),
+)
+COMFY_RECEIVED_BYTES = Counter("comfy_received_bytes_total", "Image bytes received from ComfyUI.")
+IMAGE_SAVE_SECONDS = Histogram("image_save_duration_seconds", "Time to write and index a generated image.")
+IMAGES_DEDUPLICATED = Counter(
+    "images_deduplicated_total", "Generated images not stored because an identical one already was."
+)
+THUMBNAIL_SECONDS = Histogram("thumbnail_render_duration_seconds", "Thumbnail decode, resize and encode time.", ("format",))
+TAG_INDEX_BUILD_SECONDS = Histogram(
+    "tag_index_build_duration_seconds", "Time to parse a tag file and build its search index.", ("file",)
+)
+IMAGE_INDEX_SECONDS = Histogram(
+    "image_index_duration_seconds", "Image index query and sync time.", ("operation",)
+)
+DISK_READ_BYTES = Counter("disk_read_bytes_total", "Bytes of files served from disk.", ("kind",))
+DISK_WRITE_BYTES = Counter("disk_write_bytes_total", "Bytes written to disk.", ("kind",))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every request by its route template. Streaming
+    responses (server-sent events) are counted as in flight but not timed,
+    since their duration is the client's connection time.
+    """
+
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response = {"status": 500, "streaming": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["streaming"] = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+
+        # EventSource connections stay open, so they are never profiled
+        accept = dict(scope.get("headers", [])).get(b"accept", b"")
+        token = None
+        if self.profiler is not None and b"text/event-stream" not in accept:
+            token = self.profiler.request_started()
+        started = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            duration = time.perf_counter() - started
+            # The router records the matched route in the shared scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            if not response["streaming"]:
+                HTTP_REQUEST_SECONDS.observe(
+                    duration, method=scope["method"], route=route, status=response["status"]
+                )
+            if token is not None:
+                self.profiler.request_finished(token, f"{scope['method']} {route}", duration)
@@ -1,9 +1,41 @@
 # models.py
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from constants import MAX_BATCH_SIZE
 
 class Prompt(BaseModel):
     positive_clip: str
     negative_clip: str
     character_tags: List[str]
     artist_tags: List[str]
+    seed: Optional[int] = None
+    workflow: str = "default"
+
+class BatchPrompt(BaseModel):
+    # Explicit prompt variations
+    prompts: List[Prompt] = []
+    # Cartesian spec: one prompt per character x artist pair. The clip may
+    # contain {character} and {artist} placeholders; otherwise the pair's
+    # tags are prepended to it.
+    positive_clip: str = ""
+    negative_clip: str = ""
+    workflow: str = "default"
+    character_tags: List[str] = []
+    artist_tags: List[str] = []
+    # Number of differently seeded runs of every variation
+    seed_count: int = Field(1, ge=1, le=MAX_BATCH_SIZE)
+    max_in_flight: Optional[int] = Field(None, ge=1)
+
+class BulkDeleteRequest(BaseModel):
+    # Images to delete: those named, or else every image matching the
+    # filters, as in the /images/ listing; several tags match any of them
+    filenames: Optional[List[str]] = None
+    character: Optional[List[str]] = None
+    artist: Optional[List[str]] = None
+
+class RandomTagRequest(BaseModel):
+    categories: List[str]
+    count: int = 1
+    seed: Optional[int] = None
+    weighted: bool = False
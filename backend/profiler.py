@@ -0,0 +1,101 @@
+# profiler.py
+import os
+import sys
+import time
+import threading
+from collections import Counter, deque
+
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+MAX_SAMPLES = 50_000  # Samples kept while requests are running
+MAX_STACK_DEPTH = 40
+MAX_REPORTS = 50
+TOP_STACKS = 10
+# Innermost frames in these files mean the thread is idle, not working
+IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "thread.py")
+
+
+def _stack(frame) -> tuple:
+    """The (file, line, function) frames of a stack, innermost first."""
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_filename, frame.f_lineno, code.co_name))
+        frame = frame.f_back
+    return tuple(stack)
+
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler for slow requests. While any request is running, a
+    background thread samples every thread's stack; when a request takes
+    longer than `threshold` seconds, the samples taken during it are
+    aggregated into a report of its hottest stacks. It costs nothing while
+    the server is idle and isn't created at all unless enabled.
+    """
+
+    def __init__(self, threshold: float, interval: float = SAMPLE_INTERVAL, max_reports: int = MAX_REPORTS):
+        self.threshold = threshold
+        self.interval = interval
+        self.reports = deque(maxlen=max_reports)
+        self._samples = deque(maxlen=MAX_SAMPLES)
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def request_started(self) -> object:
+        token = object()
+        with self._lock:
+            self._active[token] = time.perf_counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="slow-request-profiler")
+                self._thread.start()
+        self._wake.set()
+        return token
+
+    def request_finished(self, token: object, name: str, duration: float):
+        with self._lock:
+            started = self._active.pop(token, None)
+        if started is None or duration < self.threshold:
+            return
+        finished = time.perf_counter()
+        stacks = Counter(stack for taken, stack in list(self._samples) if started <= taken <= finished)
+        report = {
+            "request": name,
+            "duration": round(duration, 4),
+            "time": time.time(),
+            "samples": sum(stacks.values()),
+            "stacks": [
+                {
+                    "count": count,
+                    # Outermost frame first, like a traceback
+                    "frames": [f"{os.path.basename(file)}:{line} {function}" for file, line, function in reversed(stack)],
+                }
+                for stack, count in stacks.most_common(TOP_STACKS)
+            ],
+        }
+        self.reports.append(report)
+        print(f"Slow request: {name} took {duration:.3f}s ({report['samples']} stack samples)")
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                oldest = min(self._active.values(), default=None)
+                if oldest is None:
+                    self._wake.clear()
+            if oldest is None:
+                self._samples.clear()
+                self._wake.wait()
+                continue
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = _stack(frame)
+                if stack and not stack[0][0].endswith(IDLE_FILES):
+                    self._samples.append((now, stack))
+            # Samples older than every running request can't be reported
+            while self._samples and self._samples[0][0] < oldest:
+                self._samples.popleft()
@@ -0,0 +1,115 @@
+# progress.py
+import io
+import json
+import base64
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+from PIL import Image
+
+PREVIEW_SIZE = 256  # Longest edge of preview frames sent to clients
+HEARTBEAT_INTERVAL = 15.0
+FINAL_EVENTS = ("completed", "failed")
+
+
+def downscale_preview(data: bytes, size: int = PREVIEW_SIZE) -> bytes:
+    """Shrink a ComfyUI preview frame (JPEG or PNG) to a small JPEG."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, "JPEG", quality=75)
+    return buffer.getvalue()
+
+
+class _Subscriber:
+    """Pending events of one client, at most one per event type."""
+
+    def __init__(self):
+        self.pending = OrderedDict()
+        self.ready = asyncio.Event()
+
+    def offer(self, event: dict):
+        # A newer event replaces an unsent one of the same type in place,
+        # so frequent event types can't starve the others
+        self.pending[event["type"]] = event
+        self.ready.set()
+
+
+class JobProgress:
+    """
+    Live progress of one generation job: status, queue position, the node
+    being executed, sampler steps and preview frames, fanned out to any
+    number of streaming clients.
+
+    Clients only ever have the latest event of each type waiting, so one
+    that reads slowly skips intermediate steps and frames rather than
+    building a backlog, and publishing never waits for a client.
+    """
+
+    def __init__(self):
+        self.state = OrderedDict()  # Event type -> latest event, for late subscribers
+        self._subscribers = set()
+        self._frame = None  # Latest raw preview frame
+        self._frame_id = 0
+        self._encoded = None  # (frame id, task encoding it)
+
+    def publish(self, kind: str, **data):
+        """Record an event and pass it on. Must be called on the event loop."""
+        if kind == "preview":
+            self._frame = data.pop("data")
+            self._frame_id += 1
+            data["frame"] = self._frame_id
+        if kind == "executing":
+            self.state.pop("queue", None)  # No longer waiting
+        event = {"type": kind, **data}
+        self.state.pop(kind, None)
+        self.state[kind] = event
+        for subscriber in self._subscribers:
+            subscriber.offer(event)
+
+    def finish(self, kind: str, **data):
+        """Publish the job's final event and let go of its preview."""
+        self.publish(kind, **data)
+        self.state.pop("preview", None)
+        self._frame = None
+
+    async def _preview_url(self) -> Optional[str]:
+        """The latest frame, downscaled once however many clients want it."""
+        if self._frame is None:
+            return None
+        if self._encoded is None or self._encoded[0] != self._frame_id:
+            task = asyncio.ensure_future(asyncio.to_thread(downscale_preview, self._frame))
+            self._encoded = (self._frame_id, task)
+        try:
+            data = await asyncio.shield(self._encoded[1])
+        except Exception:
+            return None  # Not an image Pillow can read; skip the frame
+        return "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
+
+    async def stream(self):
+        """Yield the job's current state, then its updates, as Server-Sent Events."""
+        subscriber = _Subscriber()
+        for event in self.state.values():
+            subscriber.offer(event)
+        self._subscribers.add(subscriber)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                subscriber.ready.clear()
+                while subscriber.pending:
+                    _, event = subscriber.pending.popitem(last=False)
+                    if event["type"] == "preview":
+                        image = await self._preview_url()
+                        if image is None:
+                            continue
+                        event = {**event, "image": image}
+                    yield f"data: {json.dumps(event)}\n\n"
+                    if event["type"] in FINAL_EVENTS:
+                        return
+        finally:
+            self._subscribers.discard(subscriber)
@@ -1,41 +1,112 @@
 # routes/generate.py
-from fastapi import APIRouter
-import random
-import json
-from websocket import create_connection
-import os
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
-from constants import SERVER_ADDRESS, CLIENT_ID, PROMPT_TEMPLATE_PATH
-from models import Prompt
-from utils import get_images_via_websocket, save_image
+from constants import MAX_BATCH_SIZE
+from models import Prompt, BatchPrompt
+from jobs import job_manager, expand_batch, batch_size
+from workflows import workflow_registry, WorkflowError
 
 router = APIRouter()
 
+def validate_workflow(name: str):
+    """Fail the request up front if the named workflow can't be loaded."""
+    try:
+        workflow_registry.get(name)
+    except WorkflowError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def ensure_accepting_jobs():
+    if job_manager.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down")
+
+@router.get("/workflows/")
+def list_workflows():
+    """List the names of the available workflow templates."""
+    return {"workflows": workflow_registry.names()}
+
 @router.post("/generate-image/")
 async def generate_image(prompt: Prompt):
-    """Generate an image based on the given prompt."""
-    # Load and modify the prompt template
-    with open(PROMPT_TEMPLATE_PATH, "r") as file:
-        prompt_text = json.load(file)
-    
-    # Update the prompt with data from the request
-    prompt_text["73"]["inputs"]["text"] = prompt.positive_clip
-    prompt_text["74"]["inputs"]["text"] = prompt.negative_clip
-    prompt_text["99"]["inputs"]["seed"] = random.randint(1000000000, 9999999999)
-    prompt_text["106"]["inputs"]["seed"] = random.randint(1000000000, 9999999999)
-
-    # Establish a WebSocket connection
-    ws = create_connection(f"ws://{SERVER_ADDRESS}/ws?clientId={CLIENT_ID}")
-    images = get_images_via_websocket(ws, prompt_text)
-    ws.close()
-
-    titles = []
-    for node_id, image_data_list in images.items():
-        for image_data in image_data_list:
-            character = prompt.character_tags[0].split(",")[0] if prompt.character_tags else "char"
-            artist = prompt.artist_tags[0] if prompt.artist_tags else "artist"
-            paths = save_image(image_data, node_id, character, artist)
-            title = os.path.basename(paths["original"])
-            titles.append(title)
-
-    return {"titles": titles}
+    """Generate an image based on the given prompt and wait for the result."""
+    ensure_accepting_jobs()
+    validate_workflow(prompt.workflow)
+    job = await job_manager.wait(job_manager.submit(prompt))
+    if job.status == "failed":
+        raise HTTPException(status_code=502, detail=f"Image generation failed: {job.error}")
+    return {"titles": job.titles}
+
+@router.post("/jobs/", status_code=202)
+async def create_job(prompt: Prompt):
+    """Queue a generation job and return its ID immediately."""
+    ensure_accepting_jobs()
+    validate_workflow(prompt.workflow)
+    job = job_manager.submit(prompt)
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return the current status of a generation job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Stream a job's progress as Server-Sent Events: its status, position in
+    the ComfyUI queue, the node executing, sampler steps and downscaled
+    preview frames, ending with a "completed" or "failed" event. A slow
+    client receives only the latest step and frame.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        job.progress.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(
+    job_id: str,
+    wait: bool = Query(False, description="Wait for the job to finish instead of returning 409")
+):
+    """Return the titles of a finished job's images."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if wait:
+        await job_manager.wait(job)
+    if not job.done:
+        raise HTTPException(status_code=409, detail=f"Job is still {job.status}")
+    if job.status == "failed":
+        raise HTTPException(status_code=502, detail=f"Image generation failed: {job.error}")
+    return {"titles": job.titles}
+
+@router.post("/batches/", status_code=202)
+async def create_batch(batch: BatchPrompt):
+    """
+    Queue a batch of generation jobs, either explicit prompts or every
+    character x artist combination, each run `seed_count` times.
+    """
+    ensure_accepting_jobs()
+    # Checked before expanding so an oversized request is never built
+    size = batch_size(batch)
+    if not size:
+        raise HTTPException(status_code=400, detail="Batch contains no prompts")
+    if size > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {MAX_BATCH_SIZE} prompts")
+    prompts = expand_batch(batch)
+    for name in {prompt.workflow for prompt in prompts}:
+        validate_workflow(name)
+    return job_manager.submit_batch(prompts, batch.max_in_flight).to_dict()
+
+@router.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Return the progress of a batch and the titles of images finished so far."""
+    batch = job_manager.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch.to_dict()
@@ -0,0 +1,28 @@
+# routes/health.py
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from jobs import job_manager
+
+router = APIRouter()
+
+@router.get("/health")
+def health():
+    """Liveness: the server is up and serving requests."""
+    return {"status": "ok"}
+
+@router.get("/ready")
+def ready(request: Request):
+    """
+    Readiness: 200 once the server has indexed the library and warmed its
+    caches, 503 while starting up or draining for shutdown.
+    """
+    state = request.app.state
+    is_ready = getattr(state, "ready", False) and not getattr(state, "draining", False)
+    body = {
+        "status": "ready" if is_ready else "draining" if getattr(state, "draining", False) else "starting",
+        "jobs_in_flight": job_manager.in_flight(),
+        "comfy_connected": job_manager.client.connected,
+        "comfy_backends": job_manager.client.status(),
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
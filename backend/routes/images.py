@@ -1,108 +1,220 @@
 # routes/images.py
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
+from models import BulkDeleteRequest
 import os
+import json
+import asyncio
 
 from constants import IMAGES_FOLDER, THUMBNAILS_FOLDER
+from image_index import image_index, image_entry, SORT_ORDERS, decode_cursor
+from events import event_broker
+from http_cache import cached_file_response
+from duplicates import group_duplicates
+from archives import stream_archive, ARCHIVE_FORMATS
+from utils import delete_images
+from thumbnails import (
+    THUMBNAIL_SIZE,
+    THUMBNAIL_FORMATS,
+    thumbnail_cache,
+    generate_thumbnail,
+    supported_formats,
+    snap_size,
+)
 
 router = APIRouter()
 
+STREAM_CHUNK_SIZE = 500  # Records fetched per query while streaming a listing
+MAX_PAGE_SIZE = 1000
+MAX_DUPLICATE_DISTANCE = 16  # Perceptual hash bits near-duplicates may differ by
+
+def stream_image_listing(character, artist, sort, limit, cursor, total):
+    """Yield the listing JSON piece by piece, fetching records in chunks."""
+    yield f'{{"total": {total}, "images": ['
+    remaining = limit
+    first = True
+    while True:
+        chunk = STREAM_CHUNK_SIZE if remaining is None else min(remaining, STREAM_CHUNK_SIZE)
+        records, cursor = image_index.page(character, artist, sort, chunk, cursor)
+        for record in records:
+            yield ("" if first else ", ") + json.dumps(image_entry(record))
+            first = False
+        if remaining is not None:
+            remaining -= len(records)
+        if cursor is None or remaining == 0:
+            break
+    yield f"], \"next_cursor\": {json.dumps(cursor if limit is not None else None)}}}"
+
 @router.get("/images/")
 def list_images(
-    character: str = Query(None, description="Filter images by character tag"),
-    artist: str = Query(None, description="Filter images by artist tag")
+    character: Optional[List[str]] = Query(None, description="Filter images by character tag; repeat to match any"),
+    artist: Optional[List[str]] = Query(None, description="Filter images by artist tag; repeat to match any"),
+    sort: str = Query("newest", description="Sort order: newest, oldest, name or artist"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; all images if omitted"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
+    """List a page of images and their thumbnails, streamed as it is read."""
+    if sort not in SORT_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort order: {sort}")
+    if cursor:
+        try:
+            decode_cursor(cursor, sort)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    total = image_index.count(character, artist)
+    return StreamingResponse(
+        stream_image_listing(character, artist, sort, limit, cursor, total),
+        media_type="application/json",
+    )
+
+def export_files(character, artist, sort):
+    """Yield (archive name, path) of every image matching the filters, in chunks from the index."""
+    cursor = None
+    while True:
+        records, cursor = image_index.page(character, artist, sort, STREAM_CHUNK_SIZE, cursor)
+        for record in records:
+            yield record["filename"], os.path.join(IMAGES_FOLDER, record["filename"])
+        if cursor is None:
+            break
+
+@router.get("/images/export")
+def export_images(
+    character: Optional[List[str]] = Query(None, description="Filter images by character tag; repeat to match any"),
+    artist: Optional[List[str]] = Query(None, description="Filter images by artist tag; repeat to match any"),
+    sort: str = Query("newest", description="Order of the images in the archive"),
+    format: str = Query("zip", description="Archive format: zip or tar")
+):
+    """
+    Download the images matching the same filters as the listing as one
+    archive, streamed as it is built; nothing is assembled in memory or
+    on disk first.
+    """
+    if sort not in SORT_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort order: {sort}")
+    if format not in ARCHIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported archive format: {format}")
+    media_type, extension = ARCHIVE_FORMATS[format]
+    return StreamingResponse(
+        stream_archive(export_files(character, artist, sort), format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="comfygallery-images.{extension}"'},
+    )
+
+@router.post("/images/bulk-delete")
+def bulk_delete_images(request: BulkDeleteRequest):
+    """
+    Delete the named images, or every image matching the character and
+    artist filters, with their thumbnails, and report the outcome per file.
+    """
+    if request.filenames is not None:
+        filenames = request.filenames
+    elif any(request.character or []) or any(request.artist or []):
+        filenames = [record["filename"] for record in image_index.query(request.character, request.artist)]
+    else:
+        raise HTTPException(status_code=400, detail="Give filenames or a character or artist filter")
+    results = delete_images(filenames)
+    return {
+        "deleted": sum(1 for result in results if result["status"] == "deleted"),
+        "results": results,
+    }
+
+@router.get("/events")
+async def gallery_events(request: Request):
+    """
+    Stream gallery changes (image_added, image_deleted, thumbnail_ready and
+    resync) as Server-Sent Events. Reconnecting clients send Last-Event-ID
+    to receive the events they missed.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    return StreamingResponse(
+        event_broker.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/images/duplicates")
+def list_duplicates(
+    distance: int = Query(
+        0, ge=0, le=MAX_DUPLICATE_DISTANCE,
+        description="Perceptual hash bits near-duplicates may differ by; 0 for identical images only",
+    )
 ):
     """
-    List all images and their thumbnails, optionally filtered by character and artist.
+    Group images with identical content and, when `distance` is set,
+    visually near-identical ones. Images are only grouped once they have
+    been hashed, which happens in the background for older images.
     """
-    images = []
-
-    for filename in os.listdir(IMAGES_FOLDER):
-        if filename.endswith(".png"):  # Only include PNG files
-            # Apply filters if provided
-            if character and character.lower() not in filename.lower():
-                continue
-            if artist and artist.lower() not in filename.lower():
-                continue
-
-            thumbnail_filename = filename
-            thumbnail_path = os.path.join(THUMBNAILS_FOLDER, thumbnail_filename)
-            images.append({
-                "original": f"/images/{filename}",
-                "thumbnail": f"/thumb/{thumbnail_filename}" if os.path.exists(thumbnail_path) else None,
-                "title": filename.split(".")[0]
-            })
-
-    return {"images": images}
+    groups = group_duplicates(image_index.hashes(), distance)
+    return {
+        "groups": [
+            [image_entry(record) for record in map(image_index.get, group) if record is not None]
+            for group in groups
+        ]
+    }
+
+@router.get("/images/{filename}/metadata")
+def get_image_metadata(filename: str):
+    """Return the indexed metadata of a specific image."""
+    record = image_index.get(filename)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return record
 
 @router.get("/images/{filename}")
-def get_image(filename: str):
-    """Serve a specific image."""
+def get_image(filename: str, request: Request):
+    """Serve a specific image, with cache validators and Range support."""
     file_path = os.path.join(IMAGES_FOLDER, filename)
-    if not os.path.exists(file_path):
+    if os.path.basename(filename) != filename or not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(file_path)
+    return cached_file_response(request, file_path, image_index.content_hash(filename, file_path))
 
 @router.delete("/images/{filename}")
 def delete_image(filename: str):
     """Delete a specific image and its thumbnail."""
-    image_path = os.path.join(IMAGES_FOLDER, filename)
-    thumbnail_path = os.path.join(THUMBNAILS_FOLDER, filename)
-
-    if not os.path.exists(image_path):
+    result = delete_images([filename])[0]
+    if result["status"] == "not_found":
         raise HTTPException(status_code=404, detail="Image not found")
-
-    # Delete the image
-    try:
-        os.remove(image_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete image: {str(e)}")
-
-    # Delete the thumbnail if it exists
-    if os.path.exists(thumbnail_path):
-        try:
-            os.remove(thumbnail_path)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to delete thumbnail: {str(e)}")
+    if result["status"] == "error":
+        raise HTTPException(status_code=500, detail=f"Failed to delete image: {result['detail']}")
 
     return JSONResponse(content={"message": "Image and thumbnail deleted successfully"})
 
-@router.get("/images/{filename}")
-def get_image(filename: str):
-    """Serve a specific image."""
-    file_path = os.path.join(IMAGES_FOLDER, filename)
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(file_path)
-
-@router.delete("/images/{filename}")
-def delete_image(filename: str):
-    """Delete a specific image and its thumbnail."""
+@router.get("/thumb/{filename}")
+async def get_thumbnail(
+    filename: str,
+    request: Request,
+    size: Optional[int] = Query(None, gt=0, description="Longest edge in pixels, rounded up to a cached size"),
+    format: Optional[str] = Query(None, description="Image format: png, webp or avif")
+):
+    """
+    Serve a thumbnail. Without a size or format the thumbnail made at save
+    time is served (and generated if it is missing); otherwise a cached
+    variant is generated on demand.
+    """
+    if os.path.basename(filename) != filename:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
     image_path = os.path.join(IMAGES_FOLDER, filename)
-    thumbnail_path = os.path.join(THUMBNAILS_FOLDER, filename)
 
+    if size is None and format is None:
+        file_path = os.path.join(THUMBNAILS_FOLDER, filename)
+        if not os.path.exists(file_path):
+            if not os.path.exists(image_path):
+                raise HTTPException(status_code=404, detail="Thumbnail not found")
+            await generate_thumbnail(image_path, file_path)
+            event_broker.publish("thumbnail_ready", filename=filename)
+        content_hash = await asyncio.to_thread(image_index.content_hash, filename, image_path)
+        return cached_file_response(request, file_path, content_hash, "thumb", "image/png")
+
+    fmt = (format or "png").lower()
+    if fmt not in supported_formats():
+        raise HTTPException(status_code=400, detail=f"Unsupported thumbnail format: {fmt}")
     if not os.path.exists(image_path):
-        raise HTTPException(status_code=404, detail="Image not found")
-
-    # Delete the image
-    try:
-        os.remove(image_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete image: {str(e)}")
-
-    # Delete the thumbnail if it exists
-    if os.path.exists(thumbnail_path):
-        try:
-            os.remove(thumbnail_path)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to delete thumbnail: {str(e)}")
-
-    return JSONResponse(content={"message": "Image and thumbnail deleted successfully"})
-
-@router.get("/thumb/{filename}")
-def get_thumbnail(filename: str):
-    """Serve a specific thumbnail."""
-    file_path = os.path.join(THUMBNAILS_FOLDER, filename)
-    if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Thumbnail not found")
-    return FileResponse(file_path)
+
+    size = snap_size(size or THUMBNAIL_SIZE[0])
+    file_path = await thumbnail_cache.get(image_path, filename, size, fmt)
+    content_hash = await asyncio.to_thread(image_index.content_hash, filename, image_path)
+    return cached_file_response(request, file_path, content_hash, f"{size}.{fmt}", THUMBNAIL_FORMATS[fmt][1])
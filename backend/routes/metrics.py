@@ -0,0 +1,20 @@
+# routes/metrics.py
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from metrics import render_metrics
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Expose metrics in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@router.get("/metrics/slow-requests")
+def get_slow_requests(request: Request):
+    """Stack samples of recent slow requests, when SLOW_REQUEST_SECONDS is set."""
+    profiler = request.app.state.slow_request_profiler
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Slow request profiling is disabled")
+    return {"threshold": profiler.threshold, "reports": list(profiler.reports)}
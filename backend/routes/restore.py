@@ -1,86 +1,25 @@
 # routes/restore.py
-from fastapi import APIRouter, HTTPException
-import os
-import json
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
 
-from utils import ensure_deleted_tags_file
-from constants import DELETED_TAGS_FILE, DEFAULT_TAGS_FOLDER, PUBLIC_TAGS_FOLDER
+from tag_store import tag_store, STORE_FILES
+from snapshots import snapshot_manager, SnapshotError, SnapshotExists, SnapshotNotFound, DEFAULT_SNAPSHOT, CURRENT
 
 router = APIRouter()
 
 @router.post("/restore-deleted-tags")
-async def restore_deleted_tags(request: dict):
+def restore_deleted_tags(request: dict):
     """
     Restore only the deleted tags provided in the request
     to their respective active tag lists, sorted alphabetically by tag.
     """
-    try:
-        # Parse the incoming tags
-        character_tags_to_restore = request.get("characterTags", [])
-        artist_tags_to_restore = request.get("artistTags", [])
-
-        # Ensure we have tags to restore
-        if not character_tags_to_restore and not artist_tags_to_restore:
-            raise HTTPException(
-                status_code=400, detail="No tags provided for restoration"
-            )
-
-        # Load deleted tags file
-        ensure_deleted_tags_file()
-        with open(DELETED_TAGS_FILE, "r") as file:
-            deleted_tags = json.load(file)
-
-        # Restore character tags
-        char_file_path = os.path.join(PUBLIC_TAGS_FOLDER, "char.json")
-        with open(char_file_path, "r") as file:
-            current_character_tags = json.load(file)
-
-        restored_character_tags = [
-            tag for tag in deleted_tags["characterTags"]
-            if tag["tag"] in character_tags_to_restore
-        ]
-        current_character_tags.extend(restored_character_tags)
-        # Deduplicate and sort alphabetically by "tag"
-        current_character_tags = sorted(
-            {tag["tag"]: tag for tag in current_character_tags}.values(),
-            key=lambda x: x["tag"]
-        )
-
-        with open(char_file_path, "w") as file:
-            json.dump(current_character_tags, file, indent=4)
-
-        # Restore artist tags
-        artist_file_path = os.path.join(PUBLIC_TAGS_FOLDER, "artist.json")
-        with open(artist_file_path, "r") as file:
-            current_artist_tags = json.load(file)
-
-        restored_artist_tags = [
-            tag for tag in deleted_tags["artistTags"]
-            if tag["tag"] in artist_tags_to_restore
-        ]
-        current_artist_tags.extend(restored_artist_tags)
-        # Deduplicate and sort alphabetically by "tag"
-        current_artist_tags = sorted(
-            {tag["tag"]: tag for tag in current_artist_tags}.values(),
-            key=lambda x: x["tag"]
-        )
+    tags = {key: request.get(key, []) for key in STORE_FILES}
+    if not any(tags.values()):
+        raise HTTPException(status_code=400, detail="No tags provided for restoration")
 
-        with open(artist_file_path, "w") as file:
-            json.dump(current_artist_tags, file, indent=4)
-
-        # Remove the restored tags from the deleted_tags file
-        deleted_tags["characterTags"] = [
-            tag for tag in deleted_tags["characterTags"]
-            if tag["tag"] not in character_tags_to_restore
-        ]
-        deleted_tags["artistTags"] = [
-            tag for tag in deleted_tags["artistTags"]
-            if tag["tag"] not in artist_tags_to_restore
-        ]
-        with open(DELETED_TAGS_FILE, "w") as file:
-            json.dump(deleted_tags, file, indent=4)
-
-        return {"message": "Deleted tags restored successfully"}
+    try:
+        restored = tag_store.restore(tags)
+        return {"message": "Deleted tags restored successfully", "restored": restored}
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error restoring tags: {str(e)}"
@@ -88,81 +27,72 @@ async def restore_deleted_tags(request: dict):
 
 
 @router.post("/restore-database")
-async def restore_database():
+def restore_database():
     """Restore the database to its original state."""
-    try:
-        if not os.path.exists(DEFAULT_TAGS_FOLDER):
-            raise HTTPException(status_code=404, detail="Backup folder not found")
+    return restore_snapshot(DEFAULT_SNAPSHOT)
+
+
+@router.get("/snapshots")
+def list_snapshots():
+    """List the saved tag snapshots, oldest version first."""
+    return {"snapshots": snapshot_manager.list()}
 
-        for file_name in os.listdir(DEFAULT_TAGS_FOLDER):
-            backup_file_path = os.path.join(DEFAULT_TAGS_FOLDER, file_name)
-            original_file_path = os.path.join(PUBLIC_TAGS_FOLDER, file_name)
 
-            if os.path.exists(backup_file_path):
-                with open(backup_file_path, "r") as backup_file:
-                    data = json.load(backup_file)
+@router.post("/snapshots", status_code=201)
+def create_snapshot(name: Optional[str] = Query(None), description: str = Query("")):
+    """Save the current tags as a new snapshot."""
+    try:
+        return snapshot_manager.create(name, description)
+    except SnapshotExists as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
-                with open(original_file_path, "w") as original_file:
-                    json.dump(data, original_file, indent=4)
+@router.get("/snapshots/diff")
+def diff_snapshots(base: str = Query(DEFAULT_SNAPSHOT), target: str = Query(CURRENT)):
+    """Compare two snapshots; `current` stands for the live tags."""
+    try:
+        return snapshot_manager.diff(base, target)
+    except SnapshotNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Clear deleted tags
-        if os.path.exists(DELETED_TAGS_FILE):
-            with open(DELETED_TAGS_FILE, "w") as file:
-                json.dump({"characterTags": [], "artistTags": []}, file, indent=4)
 
-        return {"message": "Database restored to original state"}
+@router.post("/snapshots/{name}/restore")
+def restore_snapshot(name: str):
+    """Make a snapshot's tags the live tags."""
+    try:
+        snapshot = snapshot_manager.restore(name)
+    except SnapshotNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error restoring database: {str(e)}")
+    return {"message": f"Database restored to snapshot '{name}'", "snapshot": snapshot}
+
+
+@router.delete("/snapshots/{name}")
+def delete_snapshot(name: str):
+    try:
+        snapshot_manager.delete(name)
+    except SnapshotNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"Snapshot '{name}' deleted"}
 
 @router.post("/remove-tags")
-async def remove_tags(request: dict):
+def remove_tags(request: dict):
     """Remove specified tags and track them in deleted_tags.json."""
+    tags = {key: request.get(key, []) for key in STORE_FILES}
+    if not any(tags.values()):
+        raise HTTPException(status_code=400, detail="No tags provided for removal")
+
     try:
-        character_tags = request.get("characterTags", [])
-        artist_tags = request.get("artistTags", [])
-
-        if not character_tags and not artist_tags:
-            raise HTTPException(status_code=400, detail="No tags provided for removal")
-
-        # Load current tags
-        char_file_path = os.path.join(PUBLIC_TAGS_FOLDER, "char.json")
-        artist_file_path = os.path.join(PUBLIC_TAGS_FOLDER, "artist.json")
-
-        with open(char_file_path, "r") as file:
-            current_character_tags = json.load(file)
-        with open(artist_file_path, "r") as file:
-            current_artist_tags = json.load(file)
-
-        # Remove specified tags and save them to deleted_tags.json
-        deleted_tags = {"characterTags": [], "artistTags": []}
-
-        for tag in character_tags:
-            for item in current_character_tags:
-                if item["tag"] == tag:
-                    deleted_tags["characterTags"].append(item)
-                    current_character_tags.remove(item)
-
-        for tag in artist_tags:
-            for item in current_artist_tags:
-                if item["tag"] == tag:
-                    deleted_tags["artistTags"].append(item)
-                    current_artist_tags.remove(item)
-
-        with open(char_file_path, "w") as file:
-            json.dump(current_character_tags, file, indent=4)
-        with open(artist_file_path, "w") as file:
-            json.dump(current_artist_tags, file, indent=4)
-
-        # Update deleted_tags.json
-        if os.path.exists(DELETED_TAGS_FILE):
-            with open(DELETED_TAGS_FILE, "r") as file:
-                existing_deleted_tags = json.load(file)
-            deleted_tags["characterTags"].extend(existing_deleted_tags.get("characterTags", []))
-            deleted_tags["artistTags"].extend(existing_deleted_tags.get("artistTags", []))
-
-        with open(DELETED_TAGS_FILE, "w") as file:
-            json.dump(deleted_tags, file, indent=4)
-
-        return {"message": "Tags removed and tracked successfully"}
+        removed = tag_store.remove(tags)
+        return {"message": "Tags removed and tracked successfully", "removed": removed}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error removing tags: {str(e)}")
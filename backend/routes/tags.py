@@ -1,14 +1,34 @@
 # routes/tags.py
 from fastapi import APIRouter, HTTPException, Query
 from typing import Optional
-import json
-import os
+import random
 
-from utils import load_and_filter_tags, get_random_tag_from_file, ensure_deleted_tags_file
-from constants import DELETED_TAGS_FILE
+from utils import load_and_filter_tags, get_random_tag_from_file, search_tag_categories
+from constants import TAG_FILES
+from tag_store import tag_store
+from tag_index import PAGE_SORTS
+from models import RandomTagRequest
+
+MAX_RANDOM_TAGS = 100
+MAX_SEARCH_RESULTS = 50
+DELETED_PAGE_SIZE = 50
+MAX_DELETED_PAGE_SIZE = 1000
 
 router = APIRouter()
 
+@router.get("/tags/search")
+def search_tags(
+    q: Optional[str] = Query(None, description="Search query; case, underscores and small typos are ignored"),
+    categories: Optional[str] = Query(None, description="Comma-separated categories; all if omitted"),
+    limit: int = Query(8, ge=1, le=MAX_SEARCH_RESULTS),
+):
+    """Search every tag category in one request, ranking prefix matches above infix ones."""
+    names = [name.strip() for name in categories.split(",") if name.strip()] if categories else list(TAG_FILES)
+    unknown = [name for name in names if name not in TAG_FILES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tag categories: {', '.join(unknown)}")
+    return {"tags": search_tag_categories(names, q, limit)}
+
 @router.get("/tags/artist/")
 def get_artist_tags(q: Optional[str] = Query(None, description="Search query for artist tags")):
     return {"tags": load_and_filter_tags("artist.json", q)}
@@ -26,55 +46,72 @@ def get_participant_tags(q: Optional[str] = Query(None, description="Search quer
     return {"tags": load_and_filter_tags("participant.json", q)}
 
 @router.get("/tags/artist/random")
-def get_random_artist_tag():
+def get_random_artist_tag(weighted: bool = Query(False, description="Weight the pick by tag count")):
     """Select a random artist tag from artist.json."""
-    return get_random_tag_from_file("artist.json")
+    return get_random_tag_from_file("artist.json", weighted)
 
 @router.get("/tags/character/random")
-def get_random_character_tag():
+def get_random_character_tag(weighted: bool = Query(False, description="Weight the pick by tag count")):
     """Select a random character tag from char.json."""
-    return get_random_tag_from_file("char.json")
+    return get_random_tag_from_file("char.json", weighted)
 
 @router.get("/tags/danbooru/random")
-def get_random_danbooru_tag():
+def get_random_danbooru_tag(weighted: bool = Query(False, description="Weight the pick by tag count")):
     """Select a random Danbooru tag from danbooru.json."""
-    return get_random_tag_from_file("danbooru.json")
+    return get_random_tag_from_file("danbooru.json", weighted)
 
 @router.get("/tags/participant/random")
-def get_random_participant_tag():
+def get_random_participant_tag(weighted: bool = Query(False, description="Weight the pick by tag count")):
     """Select a random participant tag from participant.json."""
-    return get_random_tag_from_file("participant.json")
+    return get_random_tag_from_file("participant.json", weighted)
+
+@router.post("/tags/random")
+def get_random_tags(request: RandomTagRequest):
+    """
+    Select `count` random tags from each requested category in one call.
+    Passing a seed makes the selection reproducible.
+    """
+    unknown = [category for category in request.categories if category not in TAG_FILES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tag categories: {', '.join(unknown)}")
+    if not 1 <= request.count <= MAX_RANDOM_TAGS:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {MAX_RANDOM_TAGS}")
+
+    rng = random.Random(request.seed) if request.seed is not None else random
+    tags = {}
+    for category in request.categories:
+        tags[category] = [
+            get_random_tag_from_file(TAG_FILES[category], request.weighted, rng)["tag"]
+            for _ in range(request.count)
+        ]
+    return {"tags": tags}
+
+def page_deleted_tags(key: str, q: Optional[str], sort: str, limit: int, cursor: Optional[str], prefix: bool) -> dict:
+    """Search and page through a category's deleted tags."""
+    try:
+        tags, next_cursor, total = tag_store.deleted_index(key).page(q, sort, limit, cursor, prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"tags": tags, "total": total, "next_cursor": next_cursor}
 
 @router.get("/tags/deleted-character")
-async def get_deleted_character_tags():
+def get_deleted_character_tags(
+    q: Optional[str] = Query(None, description="Search query for deleted character tags"),
+    sort: str = Query("count", description=f"One of: {', '.join(PAGE_SORTS)}"),
+    limit: int = Query(DELETED_PAGE_SIZE, ge=1, le=MAX_DELETED_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    prefix: bool = Query(False, description="Match tags starting with q instead of containing it"),
+):
     """Retrieve deleted character tags."""
-    try:
-        # Ensure the file exists
-        ensure_deleted_tags_file()
-
-        # Read and return the characterTags from deleted_tags.json
-        with open(DELETED_TAGS_FILE, "r") as file:
-            deleted_tags = json.load(file)
-        return {"tags": deleted_tags.get("characterTags", [])}
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error fetching deleted character tags: {str(e)}"
-        )
+    return page_deleted_tags("characterTags", q, sort, limit, cursor, prefix)
 
 @router.get("/tags/deleted-artist")
-async def get_deleted_artist_tags():
+def get_deleted_artist_tags(
+    q: Optional[str] = Query(None, description="Search query for deleted artist tags"),
+    sort: str = Query("count", description=f"One of: {', '.join(PAGE_SORTS)}"),
+    limit: int = Query(DELETED_PAGE_SIZE, ge=1, le=MAX_DELETED_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    prefix: bool = Query(False, description="Match tags starting with q instead of containing it"),
+):
     """Retrieve deleted artist tags."""
-    try:
-        # Ensure the file exists
-        ensure_deleted_tags_file()
-
-        # Read and return the artistTags from deleted_tags.json
-        with open(DELETED_TAGS_FILE, "r") as file:
-            deleted_tags = json.load(file)
-        return {"tags": deleted_tags.get("artistTags", [])}
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error fetching deleted artist tags: {str(e)}"
-        )
+    return page_deleted_tags("artistTags", q, sort, limit, cursor, prefix)
@@ -0,0 +1,194 @@
+# snapshots.py
+import os
+import re
+import json
+import time
+import shutil
+
+from constants import PUBLIC_TAGS_FOLDER, DEFAULT_TAGS_FOLDER, DELETED_TAGS_FILE, SNAPSHOTS_FOLDER
+from tag_index import invalidate_tag_index
+from tag_store import tag_store, write_json_atomic, STORE_FILES
+
+DEFAULT_SNAPSHOT = "default"  # The shipped tag files in DEFAULT_TAGS_FOLDER
+CURRENT = "current"  # The live public tag files, for diffs
+MANIFEST = "manifest.json"
+JOURNAL = ".restore.json"
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+class SnapshotError(Exception):
+    """Raised for invalid or duplicate snapshot names."""
+
+
+class SnapshotExists(SnapshotError):
+    """Raised when creating a snapshot whose name is taken."""
+
+
+class SnapshotNotFound(SnapshotError):
+    """Raised when a snapshot doesn't exist."""
+
+
+def _tag_files(folder: str) -> list:
+    return sorted(name for name in os.listdir(folder) if name.endswith(".json") and name != MANIFEST)
+
+
+def _link_or_copy(source: str, destination: str):
+    # Tag files are only ever replaced by rename, never edited in place, so
+    # a hard link keeps the snapshot's content even after later writes
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class SnapshotManager:
+    """
+    Named, versioned copies of the public tag files. Snapshots are hard-link
+    directories, so creating one costs a few metadata operations. A restore
+    swaps files in by rename under the tag store lock and is journaled, so
+    an interrupted restore is rolled forward on the next start.
+    """
+
+    def __init__(self, folder: str = SNAPSHOTS_FOLDER, tags_folder: str = PUBLIC_TAGS_FOLDER):
+        self.folder = folder
+        self.tags_folder = tags_folder
+        self.journal_path = os.path.join(folder, JOURNAL)
+
+    def _path(self, name: str) -> str:
+        if name == DEFAULT_SNAPSHOT:
+            return DEFAULT_TAGS_FOLDER
+        if name == CURRENT:
+            return self.tags_folder
+        if not NAME_PATTERN.match(name):
+            raise SnapshotError(f"Invalid snapshot name '{name}'")
+        return os.path.join(self.folder, name)
+
+    def _manifest(self, name: str) -> dict:
+        path = self._path(name)
+        if not os.path.isdir(path):
+            raise SnapshotNotFound(f"Snapshot '{name}' not found")
+        manifest_path = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as file:
+                return json.load(file)
+        return {"name": name, "version": 0, "created": os.stat(path).st_mtime, "files": _tag_files(path)}
+
+    def list(self) -> list:
+        snapshots = [self._manifest(DEFAULT_SNAPSHOT)]
+        if os.path.isdir(self.folder):
+            for name in os.listdir(self.folder):
+                if not name.endswith(".tmp") and os.path.exists(os.path.join(self.folder, name, MANIFEST)):
+                    snapshots.append(self._manifest(name))
+        return sorted(snapshots, key=lambda snapshot: snapshot["version"])
+
+    def create(self, name: str = None, description: str = "") -> dict:
+        """Snapshot the current public tag files."""
+        os.makedirs(self.folder, exist_ok=True)
+        with tag_store.lock:
+            version = max((snapshot["version"] for snapshot in self.list()), default=0) + 1
+            name = name or f"v{version}"
+            if name in (DEFAULT_SNAPSHOT, CURRENT):
+                raise SnapshotError(f"'{name}' is a reserved snapshot name")
+            path = self._path(name)
+            if os.path.exists(path):
+                raise SnapshotExists(f"Snapshot '{name}' already exists")
+
+            temp_path = f"{path}.tmp"
+            shutil.rmtree(temp_path, ignore_errors=True)
+            os.makedirs(temp_path)
+            files = _tag_files(self.tags_folder)
+            for file_name in files:
+                _link_or_copy(os.path.join(self.tags_folder, file_name), os.path.join(temp_path, file_name))
+            manifest = {
+                "name": name,
+                "version": version,
+                "created": time.time(),
+                "description": description,
+                "files": files,
+            }
+            write_json_atomic(os.path.join(temp_path, MANIFEST), manifest)
+            os.replace(temp_path, path)
+            return manifest
+
+    def delete(self, name: str):
+        if name in (DEFAULT_SNAPSHOT, CURRENT):
+            raise SnapshotError(f"Snapshot '{name}' can't be deleted")
+        path = self._path(name)
+        if not os.path.isdir(path):
+            raise SnapshotNotFound(f"Snapshot '{name}' not found")
+        shutil.rmtree(path)
+
+    def restore(self, name: str) -> dict:
+        """Make a snapshot the live tag data."""
+        manifest = self._manifest(name)
+        os.makedirs(self.folder, exist_ok=True)
+        with tag_store.lock:
+            write_json_atomic(self.journal_path, {"snapshot": name})
+            self._apply(name)
+            os.remove(self.journal_path)
+        return manifest
+
+    def _apply(self, name: str):
+        source = self._path(name)
+        files = _tag_files(source)
+        for file_name in files:
+            destination = os.path.join(self.tags_folder, file_name)
+            temp_path = f"{destination}.restore.tmp"
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if name == DEFAULT_SNAPSHOT:
+                # Never hard-link the tracked default files into the live folder
+                shutil.copyfile(os.path.join(source, file_name), temp_path)
+            else:
+                _link_or_copy(os.path.join(source, file_name), temp_path)
+            os.replace(temp_path, destination)
+
+        # Tag files the snapshot doesn't have are reset; a snapshot without
+        # deleted tags means none are deleted
+        if os.path.basename(DELETED_TAGS_FILE) not in files:
+            write_json_atomic(DELETED_TAGS_FILE, {key: [] for key in STORE_FILES})
+        invalidate_tag_index()
+
+    def recover(self):
+        """Finish a restore that was interrupted part-way through."""
+        try:
+            with open(self.journal_path, "r") as file:
+                name = json.load(file)["snapshot"]
+        except FileNotFoundError:
+            return
+        with tag_store.lock:
+            self._apply(name)
+            os.remove(self.journal_path)
+
+    def _load(self, name: str) -> dict:
+        path = self._path(name)
+        if not os.path.isdir(path):
+            raise SnapshotNotFound(f"Snapshot '{name}' not found")
+        data = {}
+        for file_name in _tag_files(path):
+            with open(os.path.join(path, file_name), "r") as file:
+                contents = json.load(file)
+            if isinstance(contents, dict):
+                # deleted_tags.json groups its tags by category
+                for key, items in contents.items():
+                    data[f"{file_name}:{key}"] = {item["tag"]: item for item in items}
+            else:
+                data[file_name] = {item["tag"]: item for item in contents}
+        return data
+
+    def diff(self, base: str, target: str = CURRENT) -> dict:
+        """List the tags added and removed per file between two snapshots."""
+        with tag_store.lock:
+            old, new = self._load(base), self._load(target)
+        changes = {}
+        for key in sorted(old.keys() | new.keys()):
+            old_tags, new_tags = old.get(key, {}), new.get(key, {})
+            added = [tag for tag in new_tags if tag not in old_tags]
+            removed = [tag for tag in old_tags if tag not in new_tags]
+            changed = [tag for tag in new_tags if tag in old_tags and new_tags[tag] != old_tags[tag]]
+            if added or removed or changed:
+                changes[key] = {"added": added, "removed": removed, "changed": changed}
+        return {"base": base, "target": target, "changes": changes}
+
+
+snapshot_manager = SnapshotManager()
@@ -0,0 +1,184 @@
+# tag_format.py
+import os
+import sys
+import json
+import re
+import mmap
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+MAGIC = b"CGTAGS01"
+HEADER = struct.Struct("<8sQ")  # Magic, length of the JSON directory
+ALIGNMENT = 8
+
+
+def pack_strings(strings) -> tuple:
+    """Pack strings into one UTF-8 blob plus an offsets array (n + 1 entries)."""
+    chunks = []
+    offsets = array("Q", [0])
+    position = 0
+    for string in strings:
+        data = string.encode("utf-8")
+        chunks.append(data)
+        position += len(data)
+        offsets.append(position)
+    return b"".join(chunks), offsets
+
+
+def pack_postings(postings: dict) -> tuple:
+    """Pack {gram: ranks} into sorted gram strings and one flat rank array."""
+    grams = sorted(postings)
+    blob, key_offsets = pack_strings(grams)
+    offsets = array("Q", [0])
+    ranks = array("I")
+    for gram in grams:
+        ranks.extend(postings[gram])
+        offsets.append(len(ranks))
+    return blob, key_offsets, offsets, ranks
+
+
+def write_columns(path: str, columns: dict, meta: dict):
+    """
+    Write named columns (bytes or arrays) to `path`: a header, a JSON
+    directory of where each column lives, then the column data, each
+    aligned so it can be viewed in place once memory-mapped.
+    """
+    directory = {}
+    parts = []
+    position = 0
+    for name, column in columns.items():
+        data = column.tobytes() if isinstance(column, array) else bytes(column)
+        padding = -position % ALIGNMENT
+        parts.append(b"\0" * padding)
+        position += padding
+        directory[name] = [position, len(data), column.typecode if isinstance(column, array) else "B"]
+        parts.append(data)
+        position += len(data)
+
+    header = json.dumps({"meta": meta, "byteorder": sys.byteorder, "columns": directory}).encode("utf-8")
+    start = HEADER.size + len(header)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, len(header)))
+            file.write(header)
+            file.write(b"\0" * (-start % ALIGNMENT))
+            for part in parts:
+                file.write(part)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def read_columns(path: str) -> tuple:
+    """
+    Memory-map a file written by write_columns and return (meta, columns),
+    the columns being read-only views typed like the arrays written.
+    """
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < HEADER.size:
+        raise ValueError(f"{path} is not a compiled tag file")
+    magic, length = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a compiled tag file")
+    header = json.loads(mapped[HEADER.size:HEADER.size + length])
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError(f"{path} was compiled on a machine with a different byte order")
+
+    start = HEADER.size + length
+    start += -start % ALIGNMENT
+    view = memoryview(mapped)
+    columns = {}
+    for name, (offset, size, typecode) in header["columns"].items():
+        section = view[start + offset:start + offset + size]
+        columns[name] = section if typecode == "B" else section.cast(typecode)
+    return header["meta"], columns
+
+
+class StringColumn:
+    """Read-only sequence of the strings in a packed blob."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _decode(self, i: int):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._decode(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+            if i < 0:
+                raise IndexError(i)
+        return self._decode(i)  # offsets[i + 1] is out of range past the end
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._decode(i)
+
+    def containing(self, needle: str):
+        """
+        Yield, in order, the indexes of the strings containing `needle`,
+        searching the blob directly rather than decoding every string.
+        """
+        pattern = re.compile(re.escape(needle.encode("utf-8")))
+        blob, offsets = self.blob, self.offsets
+        position = 0
+        while True:
+            match = pattern.search(blob, position)
+            if match is None:
+                return
+            i = bisect_right(offsets, match.start()) - 1
+            if match.end() <= offsets[i + 1]:
+                yield i
+                position = offsets[i + 1]
+            else:
+                position = match.start() + 1  # Straddles two strings
+
+
+class JsonColumn(StringColumn):
+    """Read-only sequence of JSON values, decoded on access."""
+
+    def _decode(self, i: int):
+        return json.loads(super()._decode(i))
+
+
+class PostingTable:
+    """Read-only {gram: ranks} mapping over packed postings."""
+
+    def __init__(self, keys: StringColumn, offsets, ranks):
+        self.keys = keys
+        self.offsets = offsets
+        self.ranks = ranks
+
+    def get(self, gram: str, default=None):
+        i = bisect_left(self.keys, gram)
+        if i < len(self.keys) and self.keys[i] == gram:
+            return self.ranks[self.offsets[i]:self.offsets[i + 1]]
+        return default
+
+
+class SortedView:
+    """`keys` read in `order`, as a sequence that can be bisected."""
+
+    def __init__(self, keys, order):
+        self.keys = keys
+        self.order = order
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __getitem__(self, i: int):
+        return self.keys[self.order[i]]
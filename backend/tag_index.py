@@ -0,0 +1,540 @@
+# tag_index.py
+import os
+import json
+import time
+import heapq
+import hashlib
+import base64
+import random
+import threading
+from array import array
+from collections import Counter
+from bisect import bisect_left
+from typing import Optional
+
+from constants import TAG_INDEX_CACHE_FOLDER
+from metrics import TAG_INDEX_BUILD_SECONDS
+from tag_format import (
+    pack_strings,
+    pack_postings,
+    write_columns,
+    read_columns,
+    StringColumn,
+    JsonColumn,
+    PostingTable,
+    SortedView,
+)
+
+NGRAM_SIZE = 3
+FORMAT_VERSION = 1  # Bump when the compiled index layout changes
+STAT_INTERVAL = 1.0  # Seconds between mtime checks of an indexed file
+PAGE_SORTS = ("count", "tag")  # Orders accepted by TagIndex.page
+# Ranked search match kinds, best first
+MATCH_TIERS = ("exact", "prefix", "word", "infix", "fuzzy")
+EXACT, PREFIX, WORD, INFIX, FUZZY = range(len(MATCH_TIERS))
+MAX_FUZZY_CANDIDATES = 1000  # Typo candidates checked per query, most popular first
+
+
+def normalize_tag(text) -> str:
+    """Fold case, prompt escapes and underscores so `Ganyu_(genshin` matches `ganyu \\(genshin`."""
+    return " ".join(str(text).lower().replace("\\", "").replace("_", " ").split())
+
+
+def max_typos(query: str) -> int:
+    """Edits tolerated for a query of this length; short queries must match exactly."""
+    if len(query) < 4:
+        return 0
+    return 1 if len(query) < 8 else 2
+
+
+def prefix_distance(query: str, text: str, limit: int) -> int:
+    """
+    Optimal string alignment distance between `query` and the closest
+    prefix of `text`, or `limit + 1` once it is certain to exceed `limit`.
+    Only cells within `limit` of the diagonal can stay under it, so the
+    rest are never computed.
+    """
+    text = text[:len(query) + limit]
+    width = len(text)
+    over = limit + 1
+    previous2 = None
+    previous = [j if j <= limit else over for j in range(width + 1)]
+    for i, query_char in enumerate(query, 1):
+        current = [over] * (width + 1)
+        if i <= limit:
+            current[0] = i
+        best = current[0]
+        for j in range(max(1, i - limit), min(width, i + limit) + 1):
+            text_char = text[j - 1]
+            value = previous[j - 1] + (query_char != text_char)
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if (
+                previous2 is not None and j > 1 and query_char == text[j - 2]
+                and query[i - 2] == text_char and previous2[j - 2] + 1 < value
+            ):
+                value = previous2[j - 2] + 1
+            current[j] = value
+            if value < best:
+                best = value
+        if best > limit:
+            return over
+        previous2, previous = previous, current
+    return min(min(previous), over)
+
+
+def _grams(text: str, size: int) -> set:
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def encode_tag_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii")
+
+
+def decode_tag_cursor(cursor: str) -> tuple:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != 2:
+        raise ValueError("Invalid cursor")
+    return tuple(key)
+
+
+def _to_count(value) -> int:
+    """Convert a tag's count field to an int, treating bad values as 0."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _containing(strings, query: str, candidates):
+    """Yield the candidate ranks whose string contains `query`, in order."""
+    if isinstance(candidates, range) and isinstance(strings, StringColumn):
+        return strings.containing(query)  # A full scan of a mapped column
+    return (rank for rank in candidates if query in strings[rank])
+
+
+def _sorted_order(keys) -> array:
+    """Ranks ordered by key, ties in rank order."""
+    return array("I", sorted(range(len(keys)), key=keys.__getitem__))
+
+
+class TagIndex:
+    """
+    Search index over a list of tag dicts, held in memory or mapped from a
+    compiled file (see `save` and `load`); both expose the same columns.
+
+    Tags are held in descending count order, so a tag's position ("rank")
+    doubles as its popularity ordering and any scan in rank order yields
+    results already sorted by count.
+    """
+
+    def __init__(self, tags: list):
+        # Stable sort keeps the file order for equal counts, like nlargest
+        order = sorted(range(len(tags)), key=lambda i: -_to_count(tags[i].get("count", 0)))
+        self.tags = [tags[i] for i in order]
+        self.names = [str(tag.get("tag", "")) for tag in self.tags]
+        self.counts = array("q", (_to_count(tag.get("count", 0)) for tag in self.tags))
+        self.lowered = [name.lower() for name in self.names]
+
+        # Ranks sorted by lowered tag, for prefix range lookups
+        self._prefix_order = _sorted_order(self.lowered)
+        self._prefix_view = SortedView(self.lowered, self._prefix_order)
+
+        # N-gram posting lists, each holding ranks in ascending order
+        postings = {}
+        for rank, text in enumerate(self.lowered):
+            for gram in {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}:
+                postings.setdefault(gram, array("I")).append(rank)
+        self._ngrams = postings
+        self._alias = None
+        self._normalized = None
+        self.source = None
+
+    def save(self, path: str, source: tuple):
+        """
+        Compile the index, with its lazily built parts, into a file that
+        `load` can memory-map. `source` identifies the tag file it was
+        built from, as (mtime_ns, size).
+        """
+        if self._normalized is None:
+            self._normalized = self._build_normalized()
+        if self._alias is None:
+            self._alias = self._build_alias_table()
+        normalized, normalized_order, _, trigrams, bigrams = self._normalized
+        prob, alias = self._alias
+
+        columns = {}
+        for name, strings in (
+            ("records", (json.dumps(tag, separators=(",", ":")) for tag in self.tags)),
+            ("names", self.names),
+            ("lowered", self.lowered),
+            ("normalized", normalized),
+        ):
+            columns[name], columns[f"{name}_offsets"] = pack_strings(strings)
+        for name, postings in (("ngrams", self._ngrams), ("trigrams", trigrams), ("bigrams", bigrams)):
+            packed = pack_postings(postings)
+            for suffix, column in zip(("keys", "key_offsets", "offsets", "ranks"), packed):
+                columns[f"{name}_{suffix}"] = column
+        columns.update(
+            counts=self.counts,
+            prefix_order=self._prefix_order,
+            normalized_order=normalized_order,
+            alias_prob=prob,
+            alias=alias,
+        )
+        write_columns(path, columns, {"version": FORMAT_VERSION, "source": list(source)})
+
+    @classmethod
+    def load(cls, path: str) -> "TagIndex":
+        """Map a compiled index read-only; pages are read from disk as they are used."""
+        meta, columns = read_columns(path)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} has an old index format")
+
+        def postings(name):
+            keys = StringColumn(columns[f"{name}_keys"], columns[f"{name}_key_offsets"])
+            return PostingTable(keys, columns[f"{name}_offsets"], columns[f"{name}_ranks"])
+
+        index = cls.__new__(cls)
+        index.tags = JsonColumn(columns["records"], columns["records_offsets"])
+        index.names = StringColumn(columns["names"], columns["names_offsets"])
+        index.counts = columns["counts"]
+        index.lowered = StringColumn(columns["lowered"], columns["lowered_offsets"])
+        index._prefix_order = columns["prefix_order"]
+        index._prefix_view = SortedView(index.lowered, index._prefix_order)
+        index._ngrams = postings("ngrams")
+        index._alias = (columns["alias_prob"], columns["alias"])
+        normalized = StringColumn(columns["normalized"], columns["normalized_offsets"])
+        index._normalized = (
+            normalized,
+            columns["normalized_order"],
+            SortedView(normalized, columns["normalized_order"]),
+            postings("trigrams"),
+            postings("bigrams"),
+        )
+        index.source = tuple(meta["source"])
+        return index
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def _candidates(self, query: str):
+        """Yield ranks that may contain the query, in ascending rank order."""
+        if len(query) < NGRAM_SIZE:
+            # Short queries match densely, so a rank-ordered scan stops early
+            return range(len(self.lowered))
+        grams = {query[i:i + NGRAM_SIZE] for i in range(len(query) - NGRAM_SIZE + 1)}
+        lists = [self._ngrams.get(gram) for gram in grams]
+        if any(posting is None for posting in lists):
+            return ()
+        return min(lists, key=len)
+
+    def search(self, query: Optional[str], limit: int = 8) -> list:
+        """Return the top `limit` tags by count containing `query` (case-insensitive)."""
+        if not query:
+            return self.tags[:limit]
+        query = query.lower()
+        results = []
+        for rank in _containing(self.lowered, query, self._candidates(query)):
+            results.append(self.tags[rank])
+            if len(results) >= limit:
+                break
+        return results
+
+    def prefix_ranks(self, query: str) -> list:
+        """Return the ranks of all tags starting with `query`, sorted by count."""
+        query = query.lower()
+        order, lowered = self._prefix_order, self.lowered
+        ranks = []
+        for position in range(bisect_left(self._prefix_view, query), len(order)):
+            rank = order[position]
+            if not lowered[rank].startswith(query):
+                break
+            ranks.append(rank)
+        ranks.sort()
+        return ranks
+
+    def prefix_search(self, query: str, limit: int = 8) -> list:
+        """Return the top `limit` tags by count starting with `query`."""
+        return [self.tags[rank] for rank in self.prefix_ranks(query)[:limit]]
+
+    def matching_ranks(self, query: Optional[str], prefix: bool = False):
+        """Return the ranks of all tags containing (or starting with) `query`."""
+        if not query:
+            return range(len(self.tags))
+        query = query.lower()
+        if prefix:
+            return self.prefix_ranks(query)
+        return list(_containing(self.lowered, query, self._candidates(query)))
+
+    def page(
+        self,
+        query: Optional[str] = None,
+        sort: str = "count",
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        prefix: bool = False,
+    ) -> tuple:
+        """
+        Return (tags, next_cursor, total) for one page of the tags matching
+        `query`, by descending count or by name. The cursor holds the last
+        tag's sort key rather than a position, so pages stay consistent
+        when the index is rebuilt between requests.
+        """
+        if sort not in PAGE_SORTS:
+            raise ValueError(f"Unknown sort order: {sort}")
+        after = decode_tag_cursor(cursor) if cursor else None
+        tags, names, counts, lowered = self.tags, self.names, self.counts, self.lowered
+        ranks = self.matching_ranks(query, prefix)
+
+        if sort == "count":
+            keys = ((-counts[rank], names[rank], rank) for rank in ranks)
+        else:
+            keys = ((lowered[rank], names[rank], rank) for rank in ranks)
+        try:
+            if after is not None:
+                keys = [key for key in keys if key[:2] > after]
+            top = heapq.nsmallest(limit + 1, keys)
+        except TypeError:
+            raise ValueError("Invalid cursor")
+
+        next_cursor = encode_tag_cursor(top[limit - 1][:2]) if len(top) > limit else None
+        return [tags[key[2]] for key in top[:limit]], next_cursor, len(ranks)
+
+    def _build_normalized(self):
+        """Build the normalized keys and n-gram postings used by ranked_search."""
+        normalized = [normalize_tag(name) for name in self.names]
+        trigrams, bigrams = {}, {}
+        for rank, text in enumerate(normalized):
+            for gram in _grams(text, NGRAM_SIZE):
+                trigrams.setdefault(gram, array("I")).append(rank)
+            for gram in _grams(text, 2):
+                bigrams.setdefault(gram, array("I")).append(rank)
+        order = _sorted_order(normalized)
+        return normalized, order, SortedView(normalized, order), trigrams, bigrams
+
+    def ranked_search(self, query: Optional[str], limit: int = 8) -> list:
+        """
+        Return (tier, rank) pairs for tags matching `query` regardless of
+        case, underscores or escapes: exact and prefix matches, matches at
+        the start of a later word, other substring matches, and prefixes
+        within a few typos. Up to `limit` of each tier are returned, most
+        popular first; callers merge them by (tier, count).
+        """
+        if self._normalized is None:
+            self._normalized = self._build_normalized()
+        normalized, order, sorted_keys, trigrams, bigrams = self._normalized
+        query = normalize_tag(query or "")
+        if not query:
+            return [(PREFIX, rank) for rank in range(min(limit, len(self.tags)))]
+
+        # Exact and prefix matches sit in one range of the sorted keys
+        exact, prefix = [], []
+        for position in range(bisect_left(sorted_keys, query), len(order)):
+            rank = order[position]
+            key = normalized[rank]
+            if not key.startswith(query):
+                break
+            (exact if key == query else prefix).append(rank)
+        results = [(EXACT, rank) for rank in sorted(exact)[:limit]]
+        results += [(PREFIX, rank) for rank in heapq.nsmallest(limit, prefix)]
+        matched = set(exact) | set(prefix)
+
+        # Substring matches in popularity order, those at the start of a
+        # later word first; each scan stops once it has `limit` results
+        def scan(needle):
+            if len(needle) < NGRAM_SIZE:
+                candidates = range(len(normalized))
+            else:
+                lists = [trigrams.get(gram) for gram in _grams(needle, NGRAM_SIZE)]
+                candidates = () if any(posting is None for posting in lists) else min(lists, key=len)
+            return _containing(normalized, needle, candidates)
+
+        words = []
+        for rank in heapq.merge(scan(f" {query}"), scan(f"({query}")):
+            if rank not in matched and (not words or words[-1] != rank):
+                words.append(rank)
+                if len(words) >= limit:
+                    break
+        matched.update(words)
+        results += [(WORD, rank) for rank in words]
+        found = 0
+        for rank in scan(query):
+            if rank in matched:
+                continue
+            matched.add(rank)
+            text = normalized[rank]
+            if f" {query}" in text or f"({query}" in text:
+                continue  # A word match past the first `limit`
+            results.append((INFIX, rank))
+            found += 1
+            if found >= limit:
+                break
+
+        # Typo-tolerant prefixes, only when exact matching came up short
+        typos = max_typos(query)
+        grams = _grams(query, 2)
+        # Each edit (a transposition included) breaks at most three bigrams,
+        # so a match must share the rest with the query
+        needed = len(grams) - 3 * typos
+        if typos and needed > 0 and len(results) < limit:
+            shared = Counter()
+            for gram in grams:
+                shared.update(bigrams.get(gram, ()))
+            candidates = sorted(rank for rank, count in shared.items() if count >= needed and rank not in matched)
+            for rank in candidates[:MAX_FUZZY_CANDIDATES]:
+                text = normalized[rank]
+                # Like most autocompletes, assume the first letter is right
+                starts = [i for i in range(len(text)) if text[i] == query[0] and (i == 0 or text[i - 1] in " (")]
+                window = len(query) + typos
+                if any(
+                    len(grams & _grams(text[i:i + window], 2)) >= needed
+                    and prefix_distance(query, text[i:], typos) <= typos
+                    for i in starts
+                ):
+                    results.append((FUZZY, rank))
+                    # Fuzzy matches rank after this index's other matches,
+                    # so no more than this can make the merged top `limit`
+                    if len(results) >= limit:
+                        break
+        return results
+
+    def _build_alias_table(self):
+        """Build Vose alias tables for count-weighted sampling."""
+        n = len(self.counts)
+        total = sum(self.counts)
+        prob = array("d", [1.0] * n)
+        alias = array("I", range(n))
+        if total <= 0:
+            return prob, alias
+
+        scaled = [max(count, 0) * n / total for count in self.counts]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        return prob, alias
+
+    def sample(self, rng: random.Random = random, weighted: bool = False) -> dict:
+        """
+        Return a random tag in O(1): uniformly, or proportionally to its
+        count when `weighted` is set.
+        """
+        if not self.tags:
+            raise IndexError("Cannot sample from an empty tag index")
+        i = rng.randrange(len(self.tags))
+        if weighted:
+            if self._alias is None:
+                self._alias = self._build_alias_table()
+            prob, alias = self._alias
+            if rng.random() >= prob[i]:
+                i = alias[i]
+        return self.tags[i]
+
+
+class _CachedIndex:
+    def __init__(self, index: TagIndex, source: tuple):
+        self.index = index
+        self.source = source
+        self.checked = time.monotonic()
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _source(file_path: str) -> tuple:
+    """What identifies a version of a tag file: (mtime_ns, size)."""
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def compiled_path(file_path: str) -> str:
+    """Where the compiled index of a tag file is kept."""
+    digest = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:8]
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(TAG_INDEX_CACHE_FOLDER, f"{name}-{digest}.tagidx")
+
+
+def _compile(file_path: str, index: TagIndex, source: tuple) -> TagIndex:
+    """Write an index's compiled file and map it back, or keep it in memory if that fails."""
+    path = compiled_path(file_path)
+    try:
+        os.makedirs(TAG_INDEX_CACHE_FOLDER, exist_ok=True)
+        index.save(path, source)
+        return TagIndex.load(path)
+    except OSError:
+        return index
+
+
+def compile_tag_index(file_path: str, source: Optional[tuple] = None) -> TagIndex:
+    """
+    Return the mapped index of a tag file, reusing its compiled file when
+    that was built from the same version of the JSON and compiling a new
+    one otherwise.
+    """
+    source = source or _source(file_path)
+    try:
+        index = TagIndex.load(compiled_path(file_path))
+        if index.source == source:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass  # Missing, stale or unreadable: rebuild it
+    with TAG_INDEX_BUILD_SECONDS.time(file=os.path.basename(file_path)):
+        with open(file_path, "r") as file:
+            data = json.load(file)
+        return _compile(file_path, TagIndex(data), source)
+
+
+def load_tag_index(file_path: str) -> TagIndex:
+    """
+    Return the index for a tag JSON file, loading it on first use and
+    again when the file changes.
+    """
+    entry = _cache.get(file_path)
+    now = time.monotonic()
+    if entry is not None and now - entry.checked < STAT_INTERVAL:
+        return entry.index
+
+    source = _source(file_path)
+    if entry is not None and entry.source == source:
+        entry.checked = now
+        return entry.index
+
+    with _lock:
+        entry = _cache.get(file_path)
+        if entry is not None and entry.source == source:
+            entry.checked = now
+            return entry.index
+        entry = _CachedIndex(compile_tag_index(file_path, source), source)
+        _cache[file_path] = entry
+        return entry.index
+
+
+def store_tag_index(file_path: str, index: TagIndex):
+    """
+    Install an index built from data already in memory, skipping a re-parse.
+    It is compiled too, so the next start maps it instead of rebuilding.
+    """
+    source = _source(file_path)
+    index = _compile(file_path, index, source)
+    with _lock:
+        _cache[file_path] = _CachedIndex(index, source)
+
+
+def invalidate_tag_index(file_path: Optional[str] = None):
+    """Drop the cached index for a file, or for all files if none is given."""
+    with _lock:
+        if file_path is None:
+            _cache.clear()
+        else:
+            _cache.pop(file_path, None)
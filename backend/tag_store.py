@@ -0,0 +1,163 @@
+# tag_store.py
+import os
+import json
+import threading
+
+from constants import PUBLIC_TAGS_FOLDER, DELETED_TAGS_FILE
+from tag_index import TagIndex, store_tag_index
+from metrics import DISK_WRITE_BYTES
+
+# Request key -> live tag file for the categories that can be removed/restored
+STORE_FILES = {
+    "characterTags": "char.json",
+    "artistTags": "artist.json",
+}
+
+
+def write_json_atomic(path: str, data):
+    """Write JSON to a temporary file and rename it over `path`."""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        contents = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        with open(temp_path, "wb") as file:
+            file.write(contents)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+        DISK_WRITE_BYTES.inc(len(contents), kind="tags")
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class TagStore:
+    """
+    Live and deleted character/artist tags, held in memory as dicts keyed by
+    tag and persisted with atomic write-and-rename. All mutations run under
+    one lock, so concurrent remove/restore requests can't lose updates, and
+    only the files an operation changed are rewritten.
+    """
+
+    def __init__(self, folder: str = PUBLIC_TAGS_FOLDER, deleted_file: str = DELETED_TAGS_FILE):
+        self.folder = folder
+        self.deleted_file = deleted_file
+        self._lock = threading.RLock()
+        self._live = {}
+        self._deleted = {}
+        self._deleted_indexes = {}
+        self._mtimes = None
+
+    @property
+    def lock(self) -> threading.RLock:
+        """Held while the tag files are being replaced as a whole."""
+        return self._lock
+
+    def _paths(self) -> list:
+        return [os.path.join(self.folder, file_name) for file_name in STORE_FILES.values()] + [self.deleted_file]
+
+    def _ensure_loaded(self):
+        """(Re)load from disk if any file changed outside the store."""
+        mtimes = [_mtime(path) for path in self._paths()]
+        if mtimes == self._mtimes:
+            return
+        for key, file_name in STORE_FILES.items():
+            with open(os.path.join(self.folder, file_name), "r") as file:
+                self._live[key] = {item["tag"]: item for item in json.load(file)}
+        deleted = {}
+        if os.path.exists(self.deleted_file):
+            with open(self.deleted_file, "r") as file:
+                deleted = json.load(file)
+        self._deleted = {
+            key: {item["tag"]: item for item in deleted.get(key, [])} for key in STORE_FILES
+        }
+        self._deleted_indexes = {}
+        self._mtimes = mtimes
+
+    def _persist(self, live_keys: set, deleted_changed: bool):
+        for key in live_keys:
+            path = os.path.join(self.folder, STORE_FILES[key])
+            items = list(self._live[key].values())
+            write_json_atomic(path, items)
+            # Hand the new contents straight to the search index
+            store_tag_index(path, TagIndex(items))
+        if deleted_changed:
+            self._deleted_indexes = {}
+            write_json_atomic(
+                self.deleted_file,
+                {key: list(items.values()) for key, items in self._deleted.items()},
+            )
+        self._mtimes = [_mtime(path) for path in self._paths()]
+
+    def remove(self, tags: dict) -> dict:
+        """
+        Move tags from the live lists to the deleted list. `tags` maps a
+        STORE_FILES key to tag names; returns how many were removed per key.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            removed, changed = {}, set()
+            for key, names in tags.items():
+                live = self._live[key]
+                found = [name for name in dict.fromkeys(names) if name in live]
+                if found:
+                    # Newly deleted tags are listed first
+                    moved = {name: live.pop(name) for name in found}
+                    self._deleted[key] = {**moved, **self._deleted[key]}
+                    changed.add(key)
+                removed[key] = len(found)
+            if changed:
+                self._persist(changed, deleted_changed=True)
+            return removed
+
+    def restore(self, tags: dict) -> dict:
+        """
+        Move tags from the deleted list back to the live lists, which stay
+        sorted by tag. Returns how many were restored per key.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            restored, changed = {}, set()
+            for key, names in tags.items():
+                deleted = self._deleted[key]
+                found = [name for name in dict.fromkeys(names) if name in deleted]
+                if found:
+                    live = self._live[key]
+                    for name in found:
+                        live[name] = deleted.pop(name)
+                    self._live[key] = dict(sorted(live.items()))
+                    changed.add(key)
+                restored[key] = len(found)
+            if changed:
+                self._persist(changed, deleted_changed=True)
+            return restored
+
+    def deleted(self, key: str) -> list:
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._deleted[key].values())
+
+    def deleted_index(self, key: str) -> TagIndex:
+        """Search index over a category's deleted tags, rebuilt when they change."""
+        with self._lock:
+            self._ensure_loaded()
+            index = self._deleted_indexes.get(key)
+            if index is None:
+                index = self._deleted_indexes[key] = TagIndex(list(self._deleted[key].values()))
+            return index
+
+    def clear_deleted(self):
+        with self._lock:
+            self._ensure_loaded()
+            self._deleted = {key: {} for key in STORE_FILES}
+            self._persist(set(), deleted_changed=True)
+
+
+tag_store = TagStore()
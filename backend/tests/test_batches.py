@@ -0,0 +1,16 @@
+# tests/test_batches.py
+from models import BatchPrompt, Prompt
+from jobs import expand_batch
+
+
+def test_pinned_seed_runs_get_distinct_seeds():
+    prompt = Prompt(positive_clip="a", negative_clip="", character_tags=[], artist_tags=[], seed=42)
+    prompts = expand_batch(BatchPrompt(prompts=[prompt], seed_count=4))
+    assert [p.seed for p in prompts] == [42, 43, 44, 45]
+
+
+def test_unpinned_seed_left_to_workflow():
+    batch = BatchPrompt(character_tags=["x", "y"], seed_count=3)
+    prompts = expand_batch(batch)
+    assert len(prompts) == 6
+    assert all(p.seed is None for p in prompts)
@@ -0,0 +1,33 @@
+# tests/test_image_index.py
+import struct
+
+from image_index import ImageIndex, parse_image_filename
+
+
+def _write_png(path):
+    # Only the signature and IHDR size are read when syncing
+    path.write_bytes(b"\x89PNG\r\n\x1a\n" + struct.pack(">I4sII", 13, b"IHDR", 8, 8) + b"\0" * 8)
+
+
+def test_unknown_artist_leaves_split_empty():
+    assert parse_image_filename("miku_wlop_1.png", {"wlop"}) == ("miku", "wlop")
+    assert parse_image_filename("hatsune_miku_some_one_2.png", {"wlop"}) == ("", "")
+
+
+def test_filters_fall_back_to_filename_for_unsplit_names(tmp_path):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    for name in ("miku_wlop_1.png", "hatsune_miku_some_one_2.png", "rin_wlop_3.png"):
+        _write_png(folder / name)
+    index = ImageIndex(str(tmp_path / "index.db"))
+    index.sync(str(folder), {"wlop"})
+
+    def filenames(**filters):
+        return sorted(record["filename"] for record in index.query(**filters))
+
+    assert filenames(character="miku") == ["hatsune_miku_some_one_2.png", "miku_wlop_1.png"]
+    assert filenames(artist="some_one") == ["hatsune_miku_some_one_2.png"]
+    # A % in a filter is literal, not a LIKE wildcard
+    assert filenames(artist="some%") == []
+    assert filenames(character=["rin", "hatsune"]) == ["hatsune_miku_some_one_2.png", "rin_wlop_3.png"]
+    index.close()
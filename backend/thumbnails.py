@@ -0,0 +1,235 @@
+# thumbnails.py
+import os
+import time
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+
+try:
+    import pillow_avif  # noqa: F401  AVIF support for Pillow builds without it
+except ImportError:
+    pass
+
+from constants import THUMBNAIL_CACHE_FOLDER, THUMBNAIL_CACHE_MAX_BYTES
+from metrics import THUMBNAIL_SECONDS, DISK_WRITE_BYTES
+
+THUMBNAIL_SIZE = (350, 350)
+THUMBNAIL_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# Sizes a variant can be requested at; other sizes snap to the next one up
+THUMBNAIL_SIZES = (128, 256, 350, 512, 768, 1024)
+# URL format name -> (Pillow format, media type, encoder options)
+THUMBNAIL_FORMATS = {
+    "png": ("PNG", "image/png", {}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "avif": ("AVIF", "image/avif", {"quality": 60}),
+}
+
+_pool = None
+
+
+def get_thumbnail_pool() -> ProcessPoolExecutor:
+    """Return the shared worker pool used for thumbnail encoding."""
+    global _pool
+    if _pool is None:
+        # Spawned workers don't inherit the server's threads or sockets
+        _pool = ProcessPoolExecutor(
+            max_workers=THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_in_pool(func, *args):
+    """
+    Run a function in the worker pool. A pool broken by a dead worker is
+    replaced and the call tried once more on the new one.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = get_thumbnail_pool()
+        try:
+            return await loop.run_in_executor(pool, func, *args)
+        except BrokenProcessPool:
+            print("Thumbnail worker pool broke; starting a new one")
+            _discard_pool(pool)
+            if attempt:
+                raise
+
+
+def shutdown_thumbnail_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def supported_formats() -> list:
+    """Return the thumbnail formats the installed Pillow can encode."""
+    Image.init()
+    return [name for name, (pil_format, _, _) in THUMBNAIL_FORMATS.items() if pil_format in Image.SAVE]
+
+
+def snap_size(size: int) -> int:
+    """Round a requested size up to the nearest cached size."""
+    for allowed in THUMBNAIL_SIZES:
+        if size <= allowed:
+            return allowed
+    return THUMBNAIL_SIZES[-1]
+
+
+def make_thumbnail(source_path: str, thumbnail_path: str, size: tuple = THUMBNAIL_SIZE, fmt: str = "png") -> str:
+    """Write a thumbnail of an image. Runs inside a worker process."""
+    pil_format, _, options = THUMBNAIL_FORMATS[fmt]
+    temp_path = f"{thumbnail_path}.{os.getpid()}.tmp"
+    with Image.open(source_path) as image:
+        image.thumbnail(size)
+        image.save(temp_path, format=pil_format, **options)
+    # Rename into place so readers never see a partially written file
+    os.replace(temp_path, thumbnail_path)
+    return thumbnail_path
+
+
+def _timed_make_thumbnail(source_path: str, thumbnail_path: str, size: tuple, fmt: str) -> tuple:
+    """make_thumbnail, also returning its duration and output size for the metrics."""
+    started = time.perf_counter()
+    path = make_thumbnail(source_path, thumbnail_path, size, fmt)
+    return path, time.perf_counter() - started, os.path.getsize(path)
+
+
+async def generate_thumbnail(
+    source_path: str, thumbnail_path: str, size: tuple = THUMBNAIL_SIZE, fmt: str = "png"
+) -> str:
+    """Generate a thumbnail in the worker pool without blocking the event loop."""
+    path, elapsed, written = await run_in_pool(_timed_make_thumbnail, source_path, thumbnail_path, size, fmt)
+    THUMBNAIL_SECONDS.observe(elapsed, format=fmt)
+    DISK_WRITE_BYTES.inc(written, kind="thumbnail")
+    return path
+
+
+def perceptual_hash(source_path: str, size: int = 8) -> str:
+    """
+    64-bit difference hash of an image as hex: one bit per neighbouring
+    pixel pair of a small greyscale copy. Visually similar images differ in
+    few bits. Runs inside a worker process.
+    """
+    with Image.open(source_path) as image:
+        image.draft("L", (size * 4, size * 4))
+        pixels = list(image.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            i = row * (size + 1) + col
+            bits = bits << 1 | (pixels[i] > pixels[i + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+
+async def compute_perceptual_hash(source_path: str) -> str:
+    """perceptual_hash in the worker pool."""
+    return await run_in_pool(perceptual_hash, source_path)
+
+
+class ThumbnailCache:
+    """
+    On-disk cache of thumbnail variants (size x format), generated on first
+    request and evicted least-recently-used once the folder exceeds
+    `max_bytes`.
+    """
+
+    def __init__(self, folder: str = THUMBNAIL_CACHE_FOLDER, max_bytes: int = THUMBNAIL_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._entries = None  # path -> (size in bytes, mtime), oldest first
+        self._total = 0
+        self._pending = {}
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_atime, entry.path, stat.st_size, stat.st_mtime))
+        found.sort()
+        self._entries = OrderedDict((path, (size, mtime)) for _, path, size, mtime in found)
+        self._total = sum(size for size, _ in self._entries.values())
+
+    def variant_path(self, filename: str, size: int, fmt: str) -> str:
+        stem = os.path.splitext(filename)[0]
+        return os.path.join(self.folder, f"{stem}.{size}.{fmt}")
+
+    async def get(self, source_path: str, filename: str, size: int, fmt: str) -> str:
+        """Return the path of a variant, generating it if missing or stale."""
+        self._load()
+        path = self.variant_path(filename, size, fmt)
+        source_mtime = os.stat(source_path).st_mtime
+        entry = self._entries.get(path)
+        if entry is not None and entry[1] >= source_mtime:
+            if os.path.exists(path):
+                self._entries.move_to_end(path)
+                return path
+            # Deleted from the folder behind the cache's back; make it again
+            self._remove_entry(path)
+
+        # Concurrent requests for the same variant share one encode
+        task = self._pending.get(path)
+        if task is None:
+            task = self._pending[path] = asyncio.ensure_future(self._generate(source_path, path, size, fmt))
+            task.add_done_callback(lambda _: self._pending.pop(path, None))
+        return await asyncio.shield(task)
+
+    async def _generate(self, source_path: str, path: str, size: int, fmt: str) -> str:
+        await generate_thumbnail(source_path, path, (size, size), fmt)
+        stat = os.stat(path)
+        self._remove_entry(path)
+        self._entries[path] = (stat.st_size, stat.st_mtime)
+        self._total += stat.st_size
+        self._evict()
+        return path
+
+    def _remove_entry(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._total -= entry[0]
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            path, _ = next(iter(self._entries.items()))
+            self._remove_entry(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def discard(self, filename: str):
+        """Remove every cached variant of an image."""
+        self.discard_many([filename])
+
+    def discard_many(self, filenames: list):
+        """Remove every cached variant of several images in one pass over the cache."""
+        self._load()
+        stems = {os.path.splitext(filename)[0] for filename in filenames}
+        for path in [path for path in self._entries if os.path.basename(path).rsplit(".", 2)[0] in stems]:
+            self._remove_entry(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+thumbnail_cache = ThumbnailCache()
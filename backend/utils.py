@@ -1,23 +1,27 @@
 # utils.py
 import os
 import re
-import json
 import random
-import io
-import urllib.request
-from PIL import Image
+import asyncio
+import threading
 from typing import Optional
-from heapq import nlargest
 from fastapi import HTTPException
 
 from constants import (
-    SERVER_ADDRESS,
-    CLIENT_ID,
     IMAGES_FOLDER,
     THUMBNAILS_FOLDER,
-    DEFAULT_TAGS_FOLDER,
-    DELETED_TAGS_FILE,
+    PUBLIC_TAGS_FOLDER,
+    TAG_FILES,
+    PERCEPTUAL_HASHING,
 )
+from tag_index import load_tag_index, MATCH_TIERS
+from thumbnails import generate_thumbnail, thumbnail_cache, compute_perceptual_hash
+from content_store import content_store
+from image_index import image_index, image_entry, png_dimensions, hash_bytes
+from events import event_broker
+from metrics import IMAGE_SAVE_SECONDS, IMAGES_DEDUPLICATED, DISK_WRITE_BYTES
+
+WATCH_INTERVAL = 2.0  # Seconds between checks of the images folder
 
 def sanitize_filename(filename: str) -> str:
     """Sanitize filenames to prevent invalid characters and overly long names."""
@@ -25,105 +29,224 @@ def sanitize_filename(filename: str) -> str:
     max_length = 255
     return sanitized[:max_length]
 
-def save_image(image_data, base_filename, character, artist):
-    """Save the image and generate a thumbnail."""
-    index = 1
-    image = Image.open(io.BytesIO(image_data))
-    
-    # Create a unique filename for the original image
-    while True:
-        filename = f"{character}_{artist}_{index}.png"
-        sanitized_filename = sanitize_filename(filename)
-        file_path = os.path.join(IMAGES_FOLDER, sanitized_filename)
-        if not os.path.exists(file_path):
-            break
-        index += 1
-
-    # Save the original image
-    image.save(file_path)
-
-    # Generate and save a thumbnail
-    thumbnail_size = (350, 350)  # Adjust thumbnail size as needed
-    thumbnail_filename = f"{character}_{artist}_{index}.png"
-    sanitized_thumbnail_filename = sanitize_filename(thumbnail_filename)
-    thumbnail_path = os.path.join(THUMBNAILS_FOLDER, sanitized_thumbnail_filename)
-    image.thumbnail(thumbnail_size)
-    image.save(thumbnail_path)
+_name_counters = {}  # Base filename -> next index to try
+_name_lock = threading.Lock()
+
+def create_image_file(character: str, artist: str, image_data: bytes, content_hash: str) -> tuple:
+    """
+    Store image bytes in the content store and link them as a new
+    `{character}_{artist}_{n}.png` file. Returns the file's path and
+    whether the bytes were newly written. Names are claimed atomically, so
+    concurrent saves can't overwrite each other, and the next index per
+    name is remembered so the search doesn't rescan existing files.
+    """
+    written = content_store.put(image_data, content_hash)
+    base = f"{character}_{artist}"
+    with _name_lock:
+        index = _name_counters.get(base, 1)
+        while True:
+            filename = sanitize_filename(f"{base}_{index}.png")
+            file_path = os.path.join(IMAGES_FOLDER, filename)
+            try:
+                content_store.link(content_hash, file_path)
+                break
+            except FileExistsError:
+                index += 1
+            except FileNotFoundError:
+                # Collected as unlinked before it could be linked; store it again
+                written = content_store.put(image_data, content_hash)
+        _name_counters[base] = index + 1
+    return file_path, written
+
+def find_duplicate(content_hash: str) -> Optional[dict]:
+    """The indexed image with this content, if its file still exists."""
+    record = image_index.find_by_hash(content_hash)
+    if record is not None and os.path.exists(os.path.join(IMAGES_FOLDER, record["filename"])):
+        return record
+    return None
+
+async def save_image(image_data, base_filename, character, artist, metadata: Optional[dict] = None):
+    """
+    Save the image bytes as received, generate a thumbnail and record the
+    image in the metadata index. `metadata` holds the prompt fields to index
+    (positive_clip, negative_clip, workflow, seeds). An image identical to
+    one already in the gallery isn't saved again; the existing one's paths
+    are returned instead.
+    """
+    content_hash = hash_bytes(image_data)
+    duplicate = await asyncio.to_thread(find_duplicate, content_hash)
+    if duplicate is not None:
+        IMAGES_DEDUPLICATED.inc()
+        filename = duplicate["filename"]
+        return {
+            "original": os.path.join(IMAGES_FOLDER, filename),
+            "thumbnail": os.path.join(THUMBNAILS_FOLDER, filename),
+        }
+
+    with IMAGE_SAVE_SECONDS.time():
+        # ComfyUI already sends PNG data, so it is written without re-encoding
+        file_path, written = await asyncio.to_thread(
+            create_image_file, character, artist, image_data, content_hash
+        )
+        filename = os.path.basename(file_path)
+        if written:
+            DISK_WRITE_BYTES.inc(len(image_data), kind="image")
+
+        width, height = png_dimensions(image_data)
+        await asyncio.to_thread(
+            image_index.add,
+            filename,
+            sanitize_filename(character),
+            sanitize_filename(artist),
+            width=width,
+            height=height,
+            file_size=len(image_data),
+            content_hash=content_hash,
+            **(metadata or {}),
+        )
+        record = await asyncio.to_thread(image_index.get, filename)
+    event_broker.publish("image_added", filename=filename, image=image_entry(record))
+
+    # The image is stored and announced by now, so these are best effort:
+    # /thumb renders a missing thumbnail on request and the hash backfill
+    # picks up an image without a perceptual hash
+    thumbnail_path = os.path.join(THUMBNAILS_FOLDER, filename)
+    try:
+        await generate_thumbnail(file_path, thumbnail_path)
+        event_broker.publish("thumbnail_ready", filename=filename)
+    except Exception as e:
+        print(f"Failed to generate thumbnail for {filename}: {e}")
+    if PERCEPTUAL_HASHING:
+        try:
+            phash = await compute_perceptual_hash(file_path)
+            await asyncio.to_thread(image_index.set_hashes, filename, content_hash, phash)
+        except Exception as e:
+            print(f"Failed to hash {filename}: {e}")
 
     return {"original": file_path, "thumbnail": thumbnail_path}
 
-def queue_prompt(prompt):
-    """Send the prompt to the backend server."""
-    data = json.dumps({"prompt": prompt, "client_id": CLIENT_ID}).encode("utf-8")
-    req = urllib.request.Request(f"http://{SERVER_ADDRESS}/prompt", data=data)
-    return json.loads(urllib.request.urlopen(req).read())
-
-def get_images_via_websocket(ws, prompt):
-    """Retrieve images via WebSocket."""
-    prompt_id = queue_prompt(prompt)["prompt_id"]
-    output_images = {}
-    current_node = ""
-
+def delete_images(filenames: list) -> list:
+    """
+    Delete several images with their thumbnails in one pass, then drop
+    their index records in a single transaction. Returns a result per
+    filename, with status "deleted", "not_found" or "error".
+    """
+    records = image_index.get_many(filenames)
+    results, deleted, stale = [], [], []
+    for filename in dict.fromkeys(filenames):
+        if os.path.basename(filename) != filename:
+            results.append({"filename": filename, "status": "not_found"})
+            continue
+        try:
+            os.remove(os.path.join(IMAGES_FOLDER, filename))
+        except FileNotFoundError:
+            if filename in records:
+                stale.append(filename)  # Indexed but already gone from disk
+            results.append({"filename": filename, "status": "not_found"})
+            continue
+        except OSError as e:
+            results.append({"filename": filename, "status": "error", "detail": str(e)})
+            continue
+        try:
+            os.remove(os.path.join(THUMBNAILS_FOLDER, filename))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Failed to delete thumbnail of {filename}: {e}")
+        deleted.append(filename)
+        results.append({"filename": filename, "status": "deleted"})
+
+    thumbnail_cache.discard_many(deleted)
+    image_index.remove_many(deleted + stale)
+    # Free stored content no remaining image links to
+    for content_hash in {records[name].get("content_hash") for name in deleted if name in records} - {None, ""}:
+        content_store.release(content_hash)
+    for filename in deleted:
+        event_broker.publish("image_deleted", filename=filename, title=filename.split(".")[0])
+    return results
+
+def sync_image_index() -> tuple:
+    """Bring the image index in line with the images folder."""
+    try:
+        # The live list, so artists added or restored since are recognised
+        artist_names = load_tag_index(os.path.join(PUBLIC_TAGS_FOLDER, TAG_FILES["artist"])).names
+    except FileNotFoundError:
+        artist_names = []
+    # "artist" is the name save_image uses when a prompt has no artist tag
+    known_artists = {sanitize_filename(name) for name in artist_names} | {"artist"}
+    return image_index.sync(IMAGES_FOLDER, known_artists)
+
+async def watch_images_folder(interval: float = WATCH_INTERVAL):
+    """
+    Poll IMAGES_FOLDER for files added or removed outside the app and
+    publish them as gallery events. The folder is only rescanned when its
+    mtime changes, so an idle library costs one stat per interval.
+    """
+    # The folder was synced at startup, so only later changes matter
+    last_mtime = os.stat(IMAGES_FOLDER).st_mtime
     while True:
-        out = ws.recv()
-        if isinstance(out, str):
-            message = json.loads(out)
-            if message["type"] == "executing" and message["data"]["prompt_id"] == prompt_id:
-                current_node = message["data"].get("node")
-                if current_node is None:
-                    break
-        else:
-            if current_node == "save_image_websocket_node":
-                images_output = output_images.get(current_node, [])
-                images_output.append(out[8:])
-                output_images[current_node] = images_output
-
-    return output_images
-
-def ensure_deleted_tags_file():
-    """Ensure that the deleted_tags.json file exists with a valid structure."""
-    if not os.path.exists(DELETED_TAGS_FILE):
-        with open(DELETED_TAGS_FILE, "w") as file:
-            json.dump({"characterTags": [], "artistTags": []}, file, indent=4)
+        await asyncio.sleep(interval)
+        try:
+            mtime = os.stat(IMAGES_FOLDER).st_mtime
+            if mtime != last_mtime:
+                last_mtime = mtime
+                added, removed = await asyncio.to_thread(sync_image_index)
+                for record in added:
+                    event_broker.publish("image_added", filename=record["filename"], image=image_entry(record))
+                if removed:
+                    await asyncio.to_thread(content_store.collect)
+                for filename in removed:
+                    thumbnail_path = os.path.join(THUMBNAILS_FOLDER, filename)
+                    if os.path.exists(thumbnail_path):
+                        os.remove(thumbnail_path)
+                    thumbnail_cache.discard(filename)
+                    event_broker.publish("image_deleted", filename=filename, title=filename.split(".")[0])
+        except Exception as e:
+            print(f"Error watching {IMAGES_FOLDER}: {e}")
 
 def load_and_filter_tags(file_name: str, query: Optional[str]) -> list:
-    """Load and filter tags from a given JSON file, optimized for speed."""
-    file_path = os.path.join(DEFAULT_TAGS_FOLDER, file_name)
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail=f"{file_name} not found")
-
+    """Return the top 8 tags by count matching the query, served from the cached index."""
+    file_path = os.path.join(PUBLIC_TAGS_FOLDER, file_name)
     try:
-        with open(file_path, "r") as file:
-            data = json.load(file)
-            # Filter by query if provided
-            filtered_data = (
-                tag for tag in data if not query or query.lower() in tag["tag"].lower()
-            )
-            # Use a heap to get the top 8 entries by count
-            top_tags = nlargest(
-                8,
-                filtered_data,
-                key=lambda x: int(x.get("count", "0"))
-            )
-            return top_tags
+        return load_tag_index(file_path).search(query, 8)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"{file_name} not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing {file_name}: {str(e)}")
 
-def get_random_tag_from_file(file_name: str):
-    """Helper function to select a random tag from a JSON file."""
-    file_path = os.path.join(DEFAULT_TAGS_FOLDER, file_name)
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail=f"{file_name} not found")
-
+def search_tag_categories(categories: list, query: Optional[str], limit: int = 8) -> list:
+    """
+    Ranked, typo-tolerant search over several tag files at once. Results
+    are merged by match quality (exact, prefix, word, infix, fuzzy) and
+    then by count, and labelled with their category and match kind.
+    """
+    matches = []
+    for category in categories:
+        file_name = TAG_FILES[category]
+        try:
+            index = load_tag_index(os.path.join(PUBLIC_TAGS_FOLDER, file_name))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"{file_name} not found")
+        for tier, rank in index.ranked_search(query, limit):
+            matches.append((tier, -index.counts[rank], category, index.tags[rank]))
+    matches.sort(key=lambda match: match[:2])
+    return [
+        {**tag, "category": category, "match": MATCH_TIERS[tier]}
+        for tier, _, category, tag in matches[:limit]
+    ]
+
+def get_random_tag_from_file(file_name: str, weighted: bool = False, rng: random.Random = random):
+    """Helper function to select a random tag from a JSON file's cached index."""
+    file_path = os.path.join(PUBLIC_TAGS_FOLDER, file_name)
     try:
-        with open(file_path, "r") as file:
-            data = json.load(file)
-
-            if not data:
-                raise HTTPException(status_code=404, detail=f"No tags found in {file_name}")
-
-            # Select a random tag
-            random_tag = random.choice(data)
-            return {"tag": random_tag}
+        index = load_tag_index(file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"{file_name} not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing {file_name}: {str(e)}")
+
+    if not len(index):
+        raise HTTPException(status_code=404, detail=f"No tags found in {file_name}")
+
+    # Select a random tag, weighted by count if requested
+    return {"tag": index.sample(rng, weighted)}
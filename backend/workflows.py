@@ -0,0 +1,125 @@
+# workflows.py
+import os
+import json
+import time
+import random
+import threading
+
+from constants import PROMPT_TEMPLATE_PATH, WORKFLOWS_FOLDER, WORKFLOW_BINDINGS
+
+DEFAULT_WORKFLOW = "default"
+STAT_INTERVAL = 1.0  # Seconds between mtime checks of a template file
+
+
+class WorkflowError(Exception):
+    """Raised when a workflow is unknown or its template does not match its bindings."""
+
+
+class Workflow:
+    """A parsed, validated workflow template."""
+
+    def __init__(self, name: str, path: str, template: dict, bindings: dict, mtime: float):
+        self.name = name
+        self.path = path
+        self.template = template
+        self.bindings = bindings
+        self.mtime = mtime
+        self.checked = time.monotonic()
+        self._validate()
+
+    def _validate(self):
+        for field, targets in self.bindings.items():
+            for node_id, input_name in targets:
+                node = self.template.get(node_id)
+                if not isinstance(node, dict) or input_name not in node.get("inputs", {}):
+                    raise WorkflowError(
+                        f"Workflow '{self.name}' has no input '{input_name}' on node '{node_id}' "
+                        f"(bound to '{field}')"
+                    )
+
+    def build(self, positive: str, negative: str, seed: int = None) -> dict:
+        """
+        Return a request payload from the cached template. Only the patched
+        nodes are copied; all other nodes are shared with the template, so
+        the payload must be treated as read-only beyond that.
+        """
+        values = {"positive": positive, "negative": negative}
+        payload = dict(self.template)
+        for field, targets in self.bindings.items():
+            for node_id, input_name in targets:
+                if field == "seed":
+                    value = seed if seed is not None else random.randint(1000000000, 9999999999)
+                else:
+                    value = values[field]
+                node = payload[node_id]
+                if node is self.template[node_id]:
+                    node = payload[node_id] = {**node, "inputs": dict(node["inputs"])}
+                node["inputs"][input_name] = value
+        return payload
+
+    def seeds(self, payload: dict) -> list:
+        """Return the seed values a payload was built with."""
+        return [payload[node_id]["inputs"][input_name] for node_id, input_name in self.bindings.get("seed", [])]
+
+
+class WorkflowRegistry:
+    """Loads workflow templates once and reloads them when their file changes."""
+
+    def __init__(self, default_path: str = PROMPT_TEMPLATE_PATH, folder: str = WORKFLOWS_FOLDER):
+        self.default_path = default_path
+        self.folder = folder
+        self._workflows = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        if name == DEFAULT_WORKFLOW:
+            return self.default_path
+        if os.path.basename(name) != name or name.startswith("."):
+            raise WorkflowError(f"Invalid workflow name '{name}'")
+        return os.path.join(self.folder, f"{name}.json")
+
+    def names(self) -> list:
+        names = [DEFAULT_WORKFLOW]
+        if os.path.isdir(self.folder):
+            names.extend(sorted(
+                file_name[:-5] for file_name in os.listdir(self.folder) if file_name.endswith(".json")
+            ))
+        return names
+
+    def get(self, name: str = DEFAULT_WORKFLOW) -> Workflow:
+        workflow = self._workflows.get(name)
+        now = time.monotonic()
+        if workflow is not None and now - workflow.checked < STAT_INTERVAL:
+            return workflow
+
+        path = self._path(name)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            raise WorkflowError(f"Unknown workflow '{name}'")
+        if workflow is not None and workflow.mtime == mtime:
+            workflow.checked = now
+            return workflow
+
+        with self._lock:
+            workflow = self._workflows.get(name)
+            if workflow is not None and workflow.mtime == mtime:
+                return workflow
+            try:
+                with open(path, "r") as file:
+                    template = json.load(file)
+            except ValueError as e:
+                raise WorkflowError(f"Workflow '{name}' is not valid JSON: {e}")
+            bindings = WORKFLOW_BINDINGS.get(name, WORKFLOW_BINDINGS[DEFAULT_WORKFLOW])
+            workflow = Workflow(name, path, template, bindings, mtime)
+            self._workflows[name] = workflow
+            return workflow
+
+
+workflow_registry = WorkflowRegistry()
+
+
+def build_prompt_workflow(prompt) -> dict:
+    """Build the ComfyUI payload for a Prompt from its cached workflow template."""
+    workflow = workflow_registry.get(prompt.workflow)
+    return workflow.build(prompt.positive_clip, prompt.negative_clip, prompt.seed)
@@ -14,7 +14,7 @@ const App = () => {
   const [isTertiaryDrawerOpen, setTertiaryDrawerOpen] = useState(false)
   const [selectedImage, setSelectedImage] = useState(null)
   const [isModalOpen, setModalOpen] = useState(false)
-  const { images, loadImages, addImage } = useImages()
+  const { images, hasMore, loadImages, loadMore, addImage } = useImages()
   const [filteredImages, setFilteredImages] = useState([])
 
   useEffect(() => {
@@ -49,7 +49,7 @@ const App = () => {
         method: 'DELETE',
       })
       if (!response.ok) throw new Error('Failed to delete image')
-      loadImages() // Reload the images after deletion
+      // The gallery event feed removes the image from the list
       setModalOpen(false)
       setSelectedImage(null)
       setFilteredImages([]) // Reset filtered images after deletion
@@ -113,6 +113,9 @@ const App = () => {
               })
             )}
             handleCardClick={handleCardClick}
+            onLoadMore={
+              filteredImages.length === 0 && hasMore ? loadMore : null
+            }
           />
         </div>
       </div>
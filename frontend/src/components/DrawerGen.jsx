@@ -8,6 +8,7 @@ import FormControlLabel from '@mui/material/FormControlLabel'
 import Stack from '@mui/material/Stack'
 import Divider from '@mui/material/Divider'
 import CircularProgress from '@mui/material/CircularProgress'
+import LinearProgress from '@mui/material/LinearProgress'
 import IconButton from '@mui/material/IconButton'
 import ShuffleIcon from '@mui/icons-material/Shuffle'
 import PropTypes from 'prop-types'
@@ -20,7 +21,7 @@ import {
   saveToLocalStorage,
   getFromLocalStorage,
 } from '../utils/localStorageUtils'
-import { fetchRandomTag } from '../utils/apiUtils'
+import { fetchRandomTag, fetchRandomTags } from '../utils/apiUtils'
 
 const DrawerForm = ({ isDrawerOpen, addImage }) => {
   // State variables with default values
@@ -34,6 +35,7 @@ const DrawerForm = ({ isDrawerOpen, addImage }) => {
   const [positiveClip, setPositiveClip] = useState('')
   const [negativeClip, setNegativeClip] = useState('')
   const [loading, setLoading] = useState(false)
+  const [progress, setProgress] = useState({})
 
   const [characterRandomToggle, setCharacterRandomToggle] = useState(() =>
     getFromLocalStorage('characterRandomToggle', false)
@@ -78,20 +80,42 @@ const DrawerForm = ({ isDrawerOpen, addImage }) => {
     }
   }
 
+  // Merge a job progress event into the progress shown under the button
+  const handleProgress = (event) => {
+    setProgress((prev) => {
+      switch (event.type) {
+        case 'queue':
+          return { ...prev, position: event.position }
+        case 'executing':
+          return { ...prev, position: null }
+        case 'progress':
+          return { ...prev, position: null, value: event.value, max: event.max }
+        case 'preview':
+          return { ...prev, image: event.image }
+        default:
+          return prev
+      }
+    })
+  }
+
   const handleGenerate = async () => {
     setLoading(true)
+    setProgress({})
     try {
       let updatedTags = { ...tags }
 
-      if (characterRandomToggle) {
-        updatedTags.characterTags = [
-          await fetchRandomTag(API_ENDPOINTS['characterRandom']),
-        ]
-      }
-      if (artistRandomToggle) {
-        updatedTags.artistTags = [
-          await fetchRandomTag(API_ENDPOINTS['artistRandom']),
-        ]
+      // Fetch all randomized categories in a single request
+      const randomCategories = [
+        ...(characterRandomToggle ? ['character'] : []),
+        ...(artistRandomToggle ? ['artist'] : []),
+      ]
+      if (randomCategories.length > 0) {
+        const randomTags = await fetchRandomTags(randomCategories)
+        randomCategories.forEach((category) => {
+          updatedTags[`${category}Tags`] = [
+            randomTags[category]?.[0]?.tag || '',
+          ]
+        })
       }
 
       // Update the state after fetching all random tags
@@ -118,7 +142,8 @@ const DrawerForm = ({ isDrawerOpen, addImage }) => {
         positiveClipString,
         negativeClipString,
         updatedTags.characterTags,
-        updatedTags.artistTags
+        updatedTags.artistTags,
+        handleProgress
       )
 
       if (titles?.length > 0) {
@@ -136,6 +161,7 @@ const DrawerForm = ({ isDrawerOpen, addImage }) => {
       console.error('Error generating image:', error)
     } finally {
       setLoading(false)
+      setProgress({})
     }
   }
 
@@ -160,7 +186,7 @@ const DrawerForm = ({ isDrawerOpen, addImage }) => {
         <Divider className="divider-custom" />
         <Stack spacing={2}>
           <DrawerFormTagAuto
-            apiEndpoint={API_ENDPOINTS['participant']}
+            categories={['participant']}
             label="Participant"
             placeholder="1girl"
             tags={tags.participantTags}
@@ -169,7 +195,7 @@ const DrawerForm = ({ isDrawerOpen, addImage }) => {
             }
           />
           <DrawerFormTagAuto
-            apiEndpoint={API_ENDPOINTS['character']}
+            categories={['character']}
             label="Character, Series"
             placeholder="ganyu \(genshin impact\), genshin"
             tags={tags.characterTags}
@@ -194,7 +220,7 @@ const DrawerForm = ({ isDrawerOpen, addImage }) => {
             />
           </Stack>
           <DrawerFormTagAuto
-            apiEndpoint={API_ENDPOINTS['artist']}
+            categories={['artist']}
             label="Artist"
             placeholder="nyatcha"
             tags={tags.artistTags}
@@ -219,7 +245,7 @@ const DrawerForm = ({ isDrawerOpen, addImage }) => {
             />
           </Stack>
           <DrawerFormTagAuto
-            apiEndpoint={API_ENDPOINTS['danbooru']}
+            categories={['danbooru', 'participant', 'character', 'artist']}
             label="General Tags"
             placeholder="safe"
             tags={tags.generalTags}
@@ -281,6 +307,31 @@ const DrawerForm = ({ isDrawerOpen, addImage }) => {
           {loading && (
             <CircularProgress size={24} className="circular-progress-custom" />
           )}
+          {loading && progress.position != null && (
+            <Typography variant="caption" className="progress-caption">
+              {progress.position === 0
+                ? 'Up next'
+                : `Queued, ${progress.position} ahead`}
+            </Typography>
+          )}
+          {loading && progress.max > 0 && (
+            <>
+              <LinearProgress
+                variant="determinate"
+                value={(100 * progress.value) / progress.max}
+              />
+              <Typography variant="caption" className="progress-caption">
+                Step {progress.value}/{progress.max}
+              </Typography>
+            </>
+          )}
+          {loading && progress.image && (
+            <img
+              src={progress.image}
+              alt="Generation preview"
+              className="progress-preview"
+            />
+          )}
           <Button
             variant="outlined"
             color="secondary"
@@ -9,6 +9,7 @@ import PropTypes from 'prop-types'
 import '../styles/DrawerForm.css'
 import DrawerFormTagAuto from './DrawerTagAutoForm'
 import { API_ENDPOINTS } from '../utils/constants'
+import { withThumbnailVariant } from '../utils/fetchImages'
 
 const DrawerSearch = ({ isDrawerOpen, setFilteredImages }) => {
   const [characterTags, setCharacterTags] = React.useState([])
@@ -32,12 +33,9 @@ const DrawerSearch = ({ isDrawerOpen, setFilteredImages }) => {
       // Sanitize artistTags directly
       const sanitizedArtistTags = artistTags.map(sanitizeTag)
 
-      if (sanitizedCharacterTags.length > 0) {
-        params.append('character', sanitizedCharacterTags.join(' '))
-      }
-      if (sanitizedArtistTags.length > 0) {
-        params.append('artist', sanitizedArtistTags.join(' '))
-      }
+      // Repeated params match images with any of the selected tags
+      sanitizedCharacterTags.forEach((tag) => params.append('character', tag))
+      sanitizedArtistTags.forEach((tag) => params.append('artist', tag))
 
       const response = await fetch(`/api/images/?${params.toString()}`)
       if (!response.ok) throw new Error('Failed to fetch images')
@@ -48,7 +46,8 @@ const DrawerSearch = ({ isDrawerOpen, setFilteredImages }) => {
       const updatedImages = data.images.map((image) => ({
         ...image,
         original: `/api${image.original}`,
-        thumbnail: image.thumbnail ? `/api${image.thumbnail}` : null,
+        thumbnail: withThumbnailVariant(`/api${image.thumbnail}`, 'grid'),
+        preview: withThumbnailVariant(`/api${image.thumbnail}`, 'preview'),
       }))
 
       setFilteredImages(updatedImages)
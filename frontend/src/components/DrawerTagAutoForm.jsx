@@ -4,6 +4,7 @@ import Chip from '@mui/material/Chip'
 import TextField from '@mui/material/TextField'
 import Stack from '@mui/material/Stack'
 import PropTypes from 'prop-types'
+import { API_ENDPOINTS } from '../utils/constants'
 
 // Debounce utility function
 const debounce = (func, delay) => {
@@ -20,23 +21,27 @@ const DrawerFormTagAuto = ({
   tags,
   setTags,
   apiEndpoint, // Parent-provided API endpoint
+  categories, // Tag categories for the ranked search, instead of apiEndpoint
   limit = false,
 }) => {
   const [options, setOptions] = useState([]) // Available options
   const [inputValue, setInputValue] = useState('') // Controlled input value
+  const categoryList = categories ? categories.join(',') : ''
 
   // Load tags with debounce
   const loadTags = useCallback(
     debounce(async (input) => {
-      if (!apiEndpoint) {
+      if (!apiEndpoint && !categoryList) {
         setOptions([])
         return
       }
 
+      const url = categoryList
+        ? `${API_ENDPOINTS['tagSearch']}?q=${encodeURIComponent(input)}` +
+          `&categories=${encodeURIComponent(categoryList)}`
+        : `${apiEndpoint}?q=${encodeURIComponent(input)}`
       try {
-        const response = await fetch(
-          `${apiEndpoint}?q=${encodeURIComponent(input)}`
-        )
+        const response = await fetch(url)
         const data = await response.json()
         setOptions(data.tags || []) // Use tags array from the backend
       } catch (error) {
@@ -44,7 +49,7 @@ const DrawerFormTagAuto = ({
         setOptions([]) // Fallback to empty options in case of error
       }
     }, 100),
-    [apiEndpoint]
+    [apiEndpoint, categoryList]
   )
 
   // Effect to call loadTags when inputValue changes
@@ -105,6 +110,7 @@ DrawerFormTagAuto.propTypes = {
   tags: PropTypes.arrayOf(PropTypes.string).isRequired, // Tags array
   setTags: PropTypes.func.isRequired, // Function to update tags
   apiEndpoint: PropTypes.string, // API endpoint for fetching tags
+  categories: PropTypes.arrayOf(PropTypes.string), // Ranked search categories
 }
 
 export default DrawerFormTagAuto
@@ -1,25 +1,49 @@
+import { useEffect, useRef } from 'react'
 import Grid2 from '@mui/material/Grid2'
 import PropTypes from 'prop-types'
 import '../styles/ImageCatalog.css'
 import ImageCard from './ImageCard'
 
-const ImageCatalog = ({ images, handleCardClick }) => (
-  <Grid2 container spacing={1} className="image-catalog">
-    {images.map((image) => (
-      <Grid2
-        xs={12}
-        sm={6}
-        md={4}
-        lg={3}
-        key={image.id}
-        display="flex"
-        justifyContent="center"
-      >
-        <ImageCard image={image} onClick={() => handleCardClick(image)} />
+const ImageCatalog = ({ images, handleCardClick, onLoadMore = null }) => {
+  const sentinelRef = useRef(null)
+
+  // Request the next page when the end of the grid scrolls into view. The
+  // observer is re-created per page so a still-visible sentinel fires again.
+  useEffect(() => {
+    if (!onLoadMore || !sentinelRef.current) return undefined
+    const observer = new IntersectionObserver(
+      (entries) => {
+        if (entries[0].isIntersecting) onLoadMore()
+      },
+      { rootMargin: '600px' }
+    )
+    observer.observe(sentinelRef.current)
+    return () => observer.disconnect()
+  }, [onLoadMore, images.length])
+
+  return (
+    <>
+      <Grid2 container spacing={1} className="image-catalog">
+        {images.map((image) => (
+          <Grid2
+            xs={12}
+            sm={6}
+            md={4}
+            lg={3}
+            key={image.id}
+            display="flex"
+            justifyContent="center"
+          >
+            <ImageCard image={image} onClick={() => handleCardClick(image)} />
+          </Grid2>
+        ))}
       </Grid2>
-    ))}
-  </Grid2>
-)
+      {onLoadMore && (
+        <div ref={sentinelRef} className="image-catalog-sentinel" />
+      )}
+    </>
+  )
+}
 
 ImageCatalog.propTypes = {
   images: PropTypes.arrayOf(
@@ -30,6 +54,7 @@ ImageCatalog.propTypes = {
     })
   ).isRequired,
   handleCardClick: PropTypes.func.isRequired,
+  onLoadMore: PropTypes.func,
 }
 
 export default ImageCatalog
@@ -9,7 +9,7 @@ const ImageModal = ({ isOpen, image = null, onClose }) => (
       {image && (
         <>
           <img
-            src={image.original}
+            src={image.preview || image.original}
             alt={image.title}
             className="image-modal-img"
           />
@@ -25,6 +25,8 @@ ImageModal.propTypes = {
     id: PropTypes.number,
     title: PropTypes.string,
     src: PropTypes.string,
+    original: PropTypes.string,
+    preview: PropTypes.string,
   }),
   onClose: PropTypes.func.isRequired,
 }
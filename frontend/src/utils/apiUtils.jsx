@@ -1,4 +1,6 @@
 // utils/apiUtils.js
+import { API_ENDPOINTS } from './constants'
+
 export const fetchRandomTag = async (endpoint) => {
   try {
     const response = await fetch(endpoint)
@@ -12,3 +14,23 @@ export const fetchRandomTag = async (endpoint) => {
     throw error
   }
 }
+
+export const fetchRandomTags = async (categories, options = {}) => {
+  try {
+    const response = await fetch(API_ENDPOINTS.randomBatch, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ categories, ...options }),
+    })
+    if (!response.ok) {
+      throw new Error('Failed to fetch random tags')
+    }
+    const data = await response.json()
+    return data?.tags || {}
+  } catch (error) {
+    console.error(`Error fetching random tags:`, error)
+    throw error
+  }
+}
@@ -8,6 +8,8 @@ export const API_ENDPOINTS = {
   characterRandom: '/api/tags/character/random',
   danbooruRandom: '/api/tags/danbooru/random',
   participantRandom: '/api/tags/participant/random',
+  randomBatch: '/api/tags/random',
+  tagSearch: '/api/tags/search',
   removeTags: 'api/remove-tags',
   restoreDeletedTags: 'api/restore-deleted-tags',
   restoreDatabase: 'api/restore-database',
@@ -1,6 +1,29 @@
-export const fetchImages = async () => {
+// Thumbnail variants served by `/thumb/{filename}?size=&format=`
+export const THUMBNAIL_VARIANTS = {
+  grid: { size: 350, format: 'webp' },
+  preview: { size: 1024, format: 'webp' },
+}
+
+export const withThumbnailVariant = (thumbnailUrl, variant = 'grid') => {
+  const { size, format } = THUMBNAIL_VARIANTS[variant]
+  // Listing URLs may already carry a `?v=` content version
+  const separator = thumbnailUrl.includes('?') ? '&' : '?'
+  return `${thumbnailUrl}${separator}size=${size}&format=${format}`
+}
+
+export const IMAGE_PAGE_SIZE = 100
+
+export const fetchImages = async ({
+  cursor = null,
+  limit = IMAGE_PAGE_SIZE,
+  sort = 'newest',
+} = {}) => {
   try {
-    const response = await fetch('/api/images/')
+    const params = new URLSearchParams({ limit, sort })
+    if (cursor) {
+      params.append('cursor', cursor)
+    }
+    const response = await fetch(`/api/images/?${params.toString()}`)
     if (!response.ok) {
       throw new Error('Failed to fetch images')
     }
@@ -13,10 +36,14 @@ export const fetchImages = async () => {
       title: image.title,
     }))
 
-    return imagesWithApiPrefix
+    return {
+      images: imagesWithApiPrefix,
+      nextCursor: data.next_cursor,
+      total: data.total,
+    }
   } catch (error) {
     console.error('Error fetching images:', error)
-    return []
+    return { images: [], nextCursor: null, total: 0 }
   }
 }
 
@@ -1,11 +1,62 @@
+const JOB_POLL_INTERVAL = 1000
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
+
+// Poll the job until it finishes
+const pollJob = async (jobId) => {
+  for (;;) {
+    const statusResponse = await fetch(`/api/jobs/${jobId}`)
+    if (!statusResponse.ok) {
+      throw new Error(
+        `Failed to fetch job status: ${statusResponse.statusText}`
+      )
+    }
+    const job = await statusResponse.json()
+    if (job.status === 'completed') {
+      return job.titles // Updated to return only the list of titles
+    }
+    if (job.status === 'failed') {
+      throw new Error(`Failed to generate image: ${job.error}`)
+    }
+    await sleep(JOB_POLL_INTERVAL)
+  }
+}
+
+// Follow the job's progress stream, passing each event to onProgress,
+// and fall back to polling if the stream can't be opened
+const followJob = (jobId, onProgress) =>
+  new Promise((resolve, reject) => {
+    const source = new EventSource(`/api/jobs/${jobId}/events`)
+    source.onmessage = (message) => {
+      const event = JSON.parse(message.data)
+      if (event.type === 'completed') {
+        source.close()
+        resolve(event.titles)
+      } else if (event.type === 'failed') {
+        source.close()
+        reject(new Error(`Failed to generate image: ${event.error}`))
+      } else {
+        onProgress?.(event)
+      }
+    }
+    source.onerror = () => {
+      // The browser retries dropped streams itself; only give up on refusals
+      if (source.readyState === EventSource.CLOSED) {
+        pollJob(jobId).then(resolve, reject)
+      }
+    }
+  })
+
 const generateImage = async (
   positiveClip,
   negativeClip,
   characterTags,
-  artistTags
+  artistTags,
+  onProgress
 ) => {
   try {
-    const response = await fetch('/api/generate-image/', {
+    // Queue the job; the backend returns its ID immediately
+    const response = await fetch('/api/jobs/', {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -22,9 +73,8 @@ const generateImage = async (
       throw new Error(`Failed to generate image: ${response.statusText}`)
     }
 
-    const result = await response.json()
-
-    return result.titles // Updated to return only the list of titles
+    const { job_id: jobId } = await response.json()
+    return await followJob(jobId, onProgress)
   } catch (error) {
     console.error('Error generating image:', error)
     throw error
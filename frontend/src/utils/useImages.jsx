@@ -1,33 +1,98 @@
-import { useState, useCallback } from 'react'
-import { fetchImages } from './fetchImages'
+import { useState, useCallback, useEffect, useRef } from 'react'
+import { fetchImages, withThumbnailVariant } from './fetchImages'
+
+const EVENTS_ENDPOINT = '/api/events'
+
+// Listing URLs are content-versioned, so the browser can cache them as-is
+const toImage = (file) => ({
+  original: file.original,
+  thumbnail: withThumbnailVariant(file.thumbnail, 'grid'),
+  preview: withThumbnailVariant(file.thumbnail, 'preview'),
+  title: file.title, // Include the title
+})
 
 export const useImages = () => {
   const [images, setImages] = useState([])
+  const [total, setTotal] = useState(0)
+  const [hasMore, setHasMore] = useState(false)
+  const nextCursor = useRef(null)
+  const loading = useRef(false)
+  // Titles currently listed, so updates can tell whether the list changes
+  // without side effects inside state updaters
+  const titles = useRef(new Set())
 
+  // Load the first page of images, newest first
   const loadImages = useCallback(async () => {
-    // Fetch images from the API
-    const imageFiles = await fetchImages() // Call your `/api/images/` endpoint
-    const timestamp = Date.now() // Generate a unique timestamp for cache busting
-    const imageList = imageFiles.map((file, index) => ({
-      id: index + 1,
-      original: `${file.original}?v=${timestamp}`, // Add cache-busting query
-      thumbnail: `${file.thumbnail}?v=${timestamp}`, // Add cache-busting query
-      title: file.title, // Include the title
-    }))
-    setImages(imageList)
+    loading.current = true
+    const page = await fetchImages() // Call your `/api/images/` endpoint
+    nextCursor.current = page.nextCursor
+    const loaded = page.images.map(toImage)
+    titles.current = new Set(loaded.map((image) => image.title))
+    setImages(loaded)
+    setTotal(page.total)
+    setHasMore(Boolean(page.nextCursor))
+    loading.current = false
   }, [])
 
+  // Append the next page, if there is one and none is already loading
+  const loadMore = useCallback(async () => {
+    if (loading.current || !nextCursor.current) return
+    loading.current = true
+    const page = await fetchImages({ cursor: nextCursor.current })
+    nextCursor.current = page.nextCursor
+    const loaded = page.images.map(toImage)
+    loaded.forEach((image) => titles.current.add(image.title))
+    setImages((prevImages) => [...prevImages, ...loaded])
+    setTotal(page.total)
+    setHasMore(Boolean(page.nextCursor))
+    loading.current = false
+  }, [])
+
+  // Insert an image at the top unless it is already listed
+  const prependImage = useCallback((image) => {
+    if (titles.current.has(image.title)) return
+    titles.current.add(image.title)
+    setImages((prevImages) => [image, ...prevImages])
+    setTotal((prevTotal) => prevTotal + 1)
+  }, [])
+
+  // Apply server-pushed gallery changes instead of reloading the list
+  useEffect(() => {
+    const source = new EventSource(EVENTS_ENDPOINT)
+    source.onmessage = (message) => {
+      const event = JSON.parse(message.data)
+      if (event.type === 'image_added') {
+        prependImage(
+          toImage({
+            original: `/api${event.image.original}`,
+            thumbnail: `/api${event.image.thumbnail}`,
+            title: event.image.title,
+          })
+        )
+      } else if (event.type === 'image_deleted') {
+        if (!titles.current.delete(event.title)) return
+        setImages((prevImages) =>
+          prevImages.filter((image) => image.title !== event.title)
+        )
+        setTotal((prevTotal) => prevTotal - 1)
+      } else if (event.type === 'resync') {
+        loadImages()
+      }
+    }
+    return () => source.close()
+  }, [loadImages, prependImage])
+
   const addImage = (filename) => {
     const title = filename.split('.')[0] // Extract title by removing the file extension
-    const timestamp = Date.now() // Generate a unique timestamp
-    const newImage = {
-      id: images.length + 1,
-      original: `api/images/${filename}?v=${timestamp}`, // Add cache-busting query
-      thumbnail: `api/thumb/${filename}?v=${timestamp}`, // Add cache-busting query
+    // Unversioned URLs are revalidated with the server's ETag
+    const newImage = toImage({
+      original: `api/images/${filename}`,
+      thumbnail: `api/thumb/${filename}`,
       title,
-    }
-    setImages((prevImages) => [...prevImages, newImage])
+    })
+    // Newest images are listed first
+    prependImage(newImage)
   }
 
-  return { images, loadImages, addImage }
+  return { images, total, hasMore, loadImages, loadMore, addImage }
 }